@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+'''
+Benchmarks the future event lists with the classic hold model: the list is
+filled with n entries, then each step pops the earliest entry and pushes it
+back a random time later, which keeps the size steady.
+
+Usage: python benchmarks/event_list.py [SIZE ...]
+'''
+from chute.event_list import EVENT_LISTS
+import random
+import sys
+import time
+
+STEPS = 200000
+
+
+def hold(name, size, steps=STEPS):
+    '''Returns the time taken per step, in microseconds.'''
+    rng = random.Random(0)
+    events = EVENT_LISTS[name]()
+    for sequence in range(size):
+        events.push((rng.expovariate(1.0), 1, sequence, None))
+
+    sequence = size
+    start = time.time()
+    for _ in range(steps):
+        clock = events.pop()[0]
+        sequence += 1
+        events.push((clock + rng.expovariate(1.0), 1, sequence, None))
+    return (time.time() - start) / steps * 1e6
+
+
+if __name__ == '__main__':
+    sizes = [int(s) for s in sys.argv[1:]] or [100, 10000, 1000000]
+    print('%10s %12s %12s' % ('size', 'heap (us)', 'calendar (us)'))
+    for size in sizes:
+        print('%10d %12.3f %12.3f' % (
+            size,
+            hold('heap', size),
+            hold('calendar', size)
+        ))
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+'''
+Benchmarks the simulator on the example models and scaled-up versions of
+them, with fixed seeds, and writes the results as JSON. Each case is timed
+in phases, taking the best of a few runs:
+
+    - load:    executing the model code
+    - start:   creating the simulator and its first events
+    - run:     simulating with a sink that only counts events, which is the
+               cost of the engine alone
+    - output:  how much longer the run takes when writing CSV
+
+Peak memory is measured with tracemalloc in a separate run, since tracing
+slows everything down.
+
+Usage: python benchmarks/models.py [CASE ...] > results.json
+'''
+from chute.runner import load_models
+from chute.simulator import Simulator
+from chute.sink import NullSink
+import io
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+EXAMPLES = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        '..', 'examples')
+REPEAT = 3
+SEED = 0
+
+# Scaled-up models that are not among the examples.
+MMK_LARGE = '''
+import chute
+
+servers = chute.Pool('server', 100)
+
+@chute.process(chute.dist.exponential(50))
+def customer():
+    yield chute.request, servers
+    yield chute.hold, chute.dist.exponential(.75)
+    yield chute.release
+'''
+
+MM1_BUSY = '''
+import chute
+
+@chute.process(chute.dist.exponential(.95))
+def customer():
+    yield chute.request, 'server'
+    yield chute.hold, chute.dist.exponential(1)
+    yield chute.release
+'''
+
+# Cases as (name, model file or source, time to simulate).
+CASES = [
+    ('mm1_function', 'mm1_function.py', 20000),
+    ('mm1_class',    'mm1_class.py',    20000),
+    ('mmk',          'mmk.py',          20000),
+    ('mmkrazy',      'mmkrazy.py',      20000),
+    ('mmk_large',    MMK_LARGE,         400),
+    ('mm1_busy',     MM1_BUSY,          20000),
+    ('mmk_long',     'mmk.py',          200000),
+]
+
+
+class CountingSink(NullSink):
+    '''Counts events and throws them away.'''
+    def __init__(self):
+        self.events = 0
+
+    def emit(self, simulator, event):
+        self.events += 1
+
+
+def compile_case(model):
+    '''Compiles an example file by name, or model source.'''
+    if model.endswith('.py'):
+        filename = os.path.join(EXAMPLES, model)
+        with open(filename) as f:
+            return [compile(f.read(), filename, 'exec')]
+    return [compile(model, '<benchmark>', 'exec')]
+
+
+def timed_run(code, horizon, **kwds):
+    '''Runs a simulation once. Returns it and the seconds spent per phase.'''
+    phases = {}
+
+    start = time.time()
+    processes = load_models(code)
+    phases['load'] = time.time() - start
+
+    start = time.time()
+    simulator = Simulator(seed=SEED, registry=processes, **kwds)
+    simulator.start()
+    phases['start'] = time.time() - start
+
+    start = time.time()
+    simulator.run(horizon)
+    phases['run'] = time.time() - start
+
+    return simulator, phases
+
+
+def benchmark(name, model, horizon, repeat=REPEAT):
+    '''Returns a dict of results for one case.'''
+    code = compile_case(model)
+
+    best = {}
+    for _ in range(repeat):
+        sink = CountingSink()
+        _, phases = timed_run(code, horizon, sink=sink)
+        for phase, seconds in phases.items():
+            best[phase] = min(seconds, best.get(phase, seconds))
+
+        _, phases = timed_run(code, horizon, out=io.StringIO(), fmt='csv')
+        best['csv'] = min(phases['run'], best.get('csv', phases['run']))
+
+    tracemalloc.start()
+    try:
+        simulator, _ = timed_run(code, horizon, sink=NullSink())
+        peak_bytes = simulator.memory()['peak_bytes']
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'name':              name,
+        'model':             model if model.endswith('.py') else '<source>',
+        'time':              horizon,
+        'seed':              SEED,
+        'events':            sink.events,
+        'events_per_second': sink.events / best['run'],
+        'peak_bytes':        peak_bytes,
+        'seconds': {
+            'load':   best['load'],
+            'start':  best['start'],
+            'run':    best['run'],
+            'output': max(best['csv'] - best['run'], 0.0),
+        },
+    }
+
+
+if __name__ == '__main__':
+    names = sys.argv[1:]
+    unknown = set(names).difference(name for name, _, _ in CASES)
+    if unknown:
+        sys.exit('unknown cases: %s' % ', '.join(sorted(unknown)))
+
+    results = []
+    for name, model, horizon in CASES:
+        if not names or name in names:
+            print('running %s' % name, file=sys.stderr)
+            results.append(benchmark(name, model, horizon))
+
+    json.dump({
+        'python':   platform.python_version(),
+        'platform': platform.platform(),
+        'cases':    results,
+    }, sys.stdout, indent=2, sort_keys=True)
+    print()
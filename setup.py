@@ -1,4 +1,4 @@
-from distutils.core import setup
+from setuptools import setup
 
 setup (
     name         = 'chute',
@@ -10,15 +10,20 @@ setup (
 
     package_dir = {'': 'src'},
     packages    = ['chute'],
-    scripts     = ['scripts/chute'],
+    scripts     = ['scripts/chute', 'scripts/chute-client',
+                   'scripts/chute-server'],
 
     keywords    = 'discrete event simulation des operations research',
     classifiers = [
         'Development Status :: 2 - Pre-Alpha',
         'Intended Audience :: Science/Research',
         'License :: OSI Approved :: BSD License',
+        'Programming Language :: Python :: 3',
         'Topic :: Scientific/Engineering :: Mathematics'
     ],
 
-    install_requires = ['docopt']
+    python_requires  = '>=3.8',
+    install_requires = ['docopt'],
+    # For chute.dist.vectorize, and for reading npy output.
+    extras_require   = {'numpy': ['numpy']}
 )
@@ -1,8 +1,18 @@
-from chute import dist
+from chute import dist, sink
 from chute.event import RequestEvent, HoldEvent, ReleaseEvent
+from chute.resource import Pool
 from chute.simulator import Simulator, process
+from chute.trace import Trace
 
-__all__ = 'Simulator', 'process', 'request', 'hold', 'release'
+__all__ = (
+    'Simulator',
+    'Pool',
+    'Trace',
+    'process',
+    'request',
+    'hold',
+    'release'
+)
 
 request = RequestEvent
 hold = HoldEvent
@@ -0,0 +1,187 @@
+'''
+Binary columnar output. Events are written in chunks, and every chunk is a
+series of NumPy .npy arrays: first a JSON header stored as bytes, then one
+array per column. Times are float64. Event types, process names and the
+assigned resources are dictionary encoded as int32 codes, and the header
+holds the dictionaries for that chunk. Chunks are self-contained, so the
+output of many simulations can simply be concatenated.
+
+Writing does not need NumPy. Reading does, so install chute with its numpy
+extra for that. Reading maps the columns straight from the file instead of
+parsing them:
+
+    from chute import columnar
+
+    for chunk in columnar.read('mm1.npy'):
+        print(chunk['stop_time'].mean())
+'''
+from array import array
+import json
+import sys
+
+from chute.sink import FIELDS, Sink
+
+# Column types, as array typecodes and NumPy descriptors.
+COLUMNS = (
+    ('simulation',       'q', '<i8'),
+    ('sent_time',        'd', '<f8'),
+    ('start_time',       'd', '<f8'),
+    ('stop_time',        'd', '<f8'),
+    ('event_type',       'i', '<i4'),
+    ('process_name',     'i', '<i4'),
+    ('process_instance', 'q', '<i8'),
+    ('assigned',         'i', '<i4'),
+)
+
+# Columns holding codes into one of the chunk's dictionaries.
+ENCODED = 'event_type', 'process_name', 'assigned'
+
+VERSION = 1
+
+
+def _write_npy(out, descr, length, data):
+    '''Writes raw little-endian data to out as a one dimensional .npy array.'''
+    header = "{'descr': '%s', 'fortran_order': False, 'shape': (%d,), }" % (
+        descr,
+        length
+    )
+    # Pad the header with spaces so the data starts on a 64 byte boundary.
+    padding = 63 - (10 + len(header)) % 64
+    header = (header + ' ' * padding + '\n').encode('latin1')
+    out.write(b'\x93NUMPY\x01\x00')
+    out.write(array('B', (len(header) & 0xff, len(header) >> 8)).tobytes())
+    out.write(header)
+    out.write(data)
+
+
+class ColumnarSink(Sink):
+    '''Writes events to a binary file handle in chunks of columns.'''
+    def __init__(self, out, chunk_size=65536):
+        self.out = getattr(out, 'buffer', out)  # Binary side of text files.
+        self.chunk_size = chunk_size
+        self._reset()
+
+    def _reset(self):
+        self.rows = 0
+        self.columns = [array(typecode) for _, typecode, _ in COLUMNS]
+        self.codes = dict((name, {}) for name in ENCODED)
+
+    def _encode(self, name, value):
+        codes = self.codes[name]
+        try:
+            return codes[value]
+        except KeyError:
+            code = codes[value] = len(codes)
+            return code
+
+    def emit(self, simulator, event):
+        c = self.columns
+        c[0].append(simulator.num)
+        c[1].append(_float(event.sent_time))
+        c[2].append(_float(event.start_time))
+        c[3].append(_float(event.stop_time))
+        c[4].append(self._encode('event_type', event.event_type))
+        c[5].append(self._encode('process_name', event.process_name))
+        c[6].append(event.process_instance)
+        c[7].append(self._encode(
+            'assigned',
+            ', '.join(str(x) for x in simulator.resources(event))
+        ))
+
+        self.rows += 1
+        if self.rows >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        '''Writes out whatever events are buffered as a chunk.'''
+        if not self.rows:
+            return
+
+        dictionaries = {}
+        for name, codes in self.codes.items():
+            values = [None] * len(codes)
+            for value, code in codes.items():
+                values[code] = value
+            dictionaries[name] = values
+
+        header = json.dumps({
+            'format': 'chute',
+            'version': VERSION,
+            'rows': self.rows,
+            'columns': [[name, descr] for name, _, descr in COLUMNS],
+            'dictionaries': dictionaries
+        }).encode('utf-8')
+        _write_npy(self.out, '|u1', len(header), header)
+
+        for (_, _, descr), column in zip(COLUMNS, self.columns):
+            if sys.byteorder == 'big':
+                column.byteswap()
+            _write_npy(self.out, descr, len(column), column.tobytes())
+
+        self._reset()
+
+    def close(self, simulator):
+        self.flush()
+        self.out.flush()
+
+
+def _float(value):
+    '''Times that are not set yet are stored as NaN.'''
+    return float('nan') if value is None else value
+
+
+def read(filename):
+    '''
+    Iterates over the chunks in a columnar file. Each chunk is a dict that
+    maps every field name to a read-only array mapped from the file. Encoded
+    columns hold codes, and chunk['dictionaries'] maps each of those column
+    names to the list of values its codes refer to.
+    '''
+    import numpy
+    from numpy.lib import format as npy
+
+    def next_array(f):
+        try:
+            npy.read_magic(f)
+        except ValueError:
+            return None  # End of file.
+        shape, _, dtype = npy.read_array_header_1_0(f)
+        offset = f.tell()
+        f.seek(offset + dtype.itemsize * shape[0])
+        if not shape[0]:
+            return numpy.zeros(shape, dtype)
+        return numpy.memmap(filename, dtype, 'r', offset, shape)
+
+    with open(filename, 'rb') as f:
+        while True:
+            header = next_array(f)
+            if header is None:
+                return
+
+            header = json.loads(header.tobytes().decode('utf-8'))
+            chunk = {'dictionaries': header['dictionaries']}
+            for name, _ in header['columns']:
+                chunk[name] = next_array(f)
+            yield chunk
+
+
+def load(filename):
+    '''
+    Reads a whole columnar file into memory as one dict of arrays, keyed by
+    field name. Encoded columns are decoded into arrays of strings.
+    '''
+    import numpy
+
+    columns = dict((name, []) for name in FIELDS)
+    for chunk in read(filename):
+        for name in FIELDS:
+            column = chunk[name]
+            if name in ENCODED:
+                values = numpy.array(chunk['dictionaries'][name], dtype=object)
+                column = values[column]
+            columns[name].append(column)
+
+    return dict(
+        (name, numpy.concatenate(arrays) if arrays else numpy.array([]))
+        for name, arrays in columns.items()
+    )
@@ -1,16 +1,174 @@
+import hashlib
 import random
 
+# Variates are drawn from this generator. The simulator switches it to the
+# stream of whichever process is running, if it was given a seed.
+_random = random
+
+# Size of the blocks variates are drawn in using NumPy, or 0 to draw them
+# one at a time using the random module.
+_block_size = 0
+_blocks = {}      # (generator, distribution, parameters) -> list of variates.
+_generators = {}  # Generator -> NumPy generator seeded from it.
+_variates = {}    # (distribution, parameters) -> blocked callable.
+
+# How to draw a block of n variates of each distribution using NumPy.
+_NUMPY = {
+    'empirical':   lambda g, n, values: g.choice(values, n),
+    'exponential': lambda g, n, l: g.exponential(1.0 / l, n),
+    'gamma':       lambda g, n, alpha, beta: g.gamma(alpha, beta, n),
+    'lognormal':   lambda g, n, mu, sigma: g.lognormal(mu, sigma, n),
+    'triangular':  lambda g, n, low, high, mode: g.triangular(
+        low, mode, high, n
+    ),
+    'uniform':     lambda g, n, a, b: g.uniform(a, b, n),
+    'weibull':     lambda g, n, alpha, beta: alpha * g.weibull(beta, n),
+}
+
+
+def stream(seed, *keys):
+    '''
+    A random number generator seeded from a master seed and any number of
+    keys, such as a simulation number and process name. The same seed and
+    keys always give the same stream, and different keys give independent
+    ones.
+    '''
+    digest = hashlib.sha256(repr((seed,) + keys).encode('utf-8')).hexdigest()
+    return random.Random(int(digest, 16))
+
+
+def use(rng=None):
+    '''
+    Draws variates from rng, or from the random module if rng is None.
+    Returns the generator that was in use before.
+    '''
+    global _random
+    previous = _random
+    _random = random if rng is None else rng
+    return previous
+
+
+def reset():
+    '''Goes back to the random module and drops any buffered variates.'''
+    use(None)
+    _clear()
+
+
+def vectorize(block_size=4096):
+    '''
+    Draws variates in blocks of block_size using NumPy, which must be
+    installed, such as with the numpy extra of chute. They are still handed out one at a time by the same kind of
+    callable, from a separate block for each random stream. This applies to
+    distributions created after it is called, so it should come before any
+    processes are registered. A block_size of 0 turns it off again.
+    '''
+    global _block_size
+    if block_size:
+        import numpy  # Fails here if NumPy is not installed.
+
+    _block_size = block_size
+    _clear()
+    _variates.clear()
+
+
+def _clear():
+    '''Empties every block, including those cached by blocked callables.'''
+    for block in _blocks.values():
+        del block[:]
+    _blocks.clear()
+    _generators.clear()
+
+
+def _blocked(name, *params):
+    '''
+    Returns a callable that hands out variates from blocks drawn by NumPy.
+    The same callable is returned for the same distribution and parameters,
+    so holds that ask for a new one on every event still benefit.
+    '''
+    try:
+        return _variates[name, params]
+    except KeyError:
+        pass
+
+    cache = [None, None]  # Last generator used, and its block.
+
+    def variate():
+        block = cache[1]
+        if cache[0] is _random and block:
+            return block.pop()
+
+        key = (_random, name, params)
+        try:
+            block = _blocks[key]
+        except KeyError:
+            block = _blocks[key] = []
+
+        if not block:
+            try:
+                generator = _generators[_random]
+            except KeyError:
+                import numpy
+                generator = _generators[_random] = numpy.random.default_rng(
+                    _random.getrandbits(128)
+                )
+            variates = _NUMPY[name](generator, _block_size, *params)
+            block.extend(variates.tolist())
+
+        cache[0] = _random
+        cache[1] = block
+        return block.pop()
+
+    _variates[name, params] = variate
+    return variate
+
+
+def empirical(values):
+    '''A variate drawn with equal probability from a sequence of values.'''
+    values = list(values)
+    if _block_size:
+        return _blocked('empirical', tuple(values))
+    return lambda: _random.choice(values)
+
 
 def exponential(l):
     '''An exponential random variate with lambda=l.'''
-    return lambda: random.expovariate(l)
+    if _block_size:
+        return _blocked('exponential', l)
+    return lambda: _random.expovariate(l)
+
+
+def gamma(alpha, beta):
+    '''A gamma random variate with shape alpha and scale beta.'''
+    if _block_size:
+        return _blocked('gamma', alpha, beta)
+    return lambda: _random.gammavariate(alpha, beta)
+
+
+def lognormal(mu, sigma):
+    '''A log normal random variate whose log has mean mu and std dev sigma.'''
+    if _block_size:
+        return _blocked('lognormal', mu, sigma)
+    return lambda: _random.lognormvariate(mu, sigma)
 
 
 def triangular(low=0.0, high=1.0, mode=None):
     '''A triangular random variate with parameters a, b, mode.'''
-    return lambda: random.triangular(low, high, mode=None)
+    if mode is None:
+        mode = (low + high) / 2.0
+    if _block_size:
+        return _blocked('triangular', low, high, mode)
+    return lambda: _random.triangular(low, high, mode)
 
 
 def uniform(a=0.0, b=1.0):
     '''A uniform random variate from a to b.'''
-    return lambda: random.uniform(a, b)
+    if _block_size:
+        return _blocked('uniform', a, b)
+    return lambda: _random.uniform(a, b)
+
+
+def weibull(alpha, beta):
+    '''A Weibull random variate with scale alpha and shape beta.'''
+    if _block_size:
+        return _blocked('weibull', alpha, beta)
+    return lambda: _random.weibullvariate(alpha, beta)
@@ -1,13 +1,40 @@
+from chute.matching import Matching
+from chute.resource import Pool, Unit
+
+
 class Event(object):
-    def __init__(self, event_type, event_gen, clock, process, process_inst):
+    # Millions of events can be made in a run, and every process in the
+    # system keeps a few of them alive. Slots keep them small.
+    __slots__ = (
+        'event_type',
+        'event_gen',
+        'clock',
+        'process',
+        'process_name',
+        'process_instance',
+        'event_args',
+        'assigned',
+        'sent_time',
+        'start_time',
+        'stop_time'
+    )
+
+    # Events at the same time are processed in order of priority.
+    PRIORITY = 1
+
+    def __init__(self, event_type, event_gen, clock, process, process_inst,
+                 event_args=()):
         self.event_type = event_type
         self.event_gen = event_gen  # Event generator.
         self.clock = clock
         self.process = process
         self.process_name = process.__name__
         self.process_instance = process_inst
+        self.event_args = event_args
 
-        self.assigned = []  # Resources assigned to a process.
+        # Resources assigned to a process by this event. Only requests
+        # assign anything, so the rest share an empty tuple.
+        self.assigned = ()
 
         self.sent_time = self.clock
         self.start_time = None
@@ -26,11 +53,7 @@ class Event(object):
         # HoldRequest instances should always come first. This is to avoid
         # requestors being assigned when they are trying to hold resources.
         if self.clock == other.clock:
-            if isinstance(self, HoldEvent):
-                return True
-            elif isinstance(other, HoldEvent):
-                return False
-
+            return self.PRIORITY < other.PRIORITY
         return self.clock < other.clock
 
     def spawn(self):
@@ -53,6 +76,13 @@ class Event(object):
             return True
         return False
 
+    def waits_on(self, simulator):
+        '''
+        Returns the resources whose release could unblock this event, or None
+        if the event cannot wait on any of them and must be polled instead.
+        '''
+        return None
+
 
 class CreateEvent(Event):
     '''
@@ -68,10 +98,11 @@ class CreateEvent(Event):
             yield chute.hold, chute.dist.exponential(0.25)
             yield chute.release
     '''
+    __slots__ = ()
     EVENT_TYPE = 'create'
 
     def __init__(self, *args):
-        super(CreateEvent, self).__init__(CreateEvent.EVENT_TYPE, *args)
+        super().__init__(CreateEvent.EVENT_TYPE, *args)
 
     def spawn(self):
         from chute.event_gen import ProcessEventGenerator
@@ -120,12 +151,23 @@ class RequestEvent(Event):
     long as we bothered the manager with them:
 
             yield chute.request, servers, servers, 'manager'
+
+    Large sets of equivalent resources are better modeled as a Pool, which
+    finds a free unit without looking at each one:
+
+            servers = chute.Pool('server', 200)
+            yield chute.request, servers, servers, 'manager'
     '''
+    __slots__ = ('unassigned', 'matching')
     EVENT_TYPE = 'request'
 
     def __init__(self, *args, **kwds):
-        super(RequestEvent, self).__init__(RequestEvent.EVENT_TYPE, *args)
-        self.event_args = kwds['event_args']
+        super().__init__(
+            RequestEvent.EVENT_TYPE,
+            *args,
+            event_args=kwds['event_args']
+        )
+        self.assigned = []
 
         # Convert each sequence of requested objects to a tuple, and
         # store it as unassigned. Once requested objects as assigned,
@@ -135,39 +177,85 @@ class RequestEvent(Event):
             if type(e) not in (list, tuple):
                 e = (e,)
             self.unassigned.append(tuple(e))
+        self.matching = None
 
     def stop(self, simulator):
         '''Assigns any requested objects that can be to the process.'''
         if simulator.clock < self.clock:
             return False
 
-        is_ok = True
-
-        # Try and assign as much as possible of what is requested.
-        new_unassigned = []
-        for request_options in self.unassigned:
-            is_assigned = False
-            for option in request_options:
-                # Ignore things already assigned.
-                if simulator.assigned_to(self, option):
-                    continue
+        # Requesters are not allowed more objects if they are currently
+        # assigned as resources to something else.
+        if self.unassigned and self.event_gen in simulator.assigned:
+            return False
 
-                # Try to get this object from the simulator.
-                if simulator.assign(self, option):
-                    self.assigned.append(option)
-                    is_assigned = True
-                    break
+        # A lone slot can simply take its first free option.
+        if len(self.unassigned) == 1 and self.matching is None:
+            for option in self.unassigned[0]:
+                resource = simulator._get_resource(option)
+                if simulator._available(resource):
+                    self._take(simulator, resource)
+                    self.unassigned = []
+                    self.stop_time = simulator.clock
+                    return True
+            return False
 
-            if not is_assigned:
-                new_unassigned.append(request_options)
+        # Each requested tuple is a slot to fill with one of its options.
+        # Things already assigned to the process can only fill a slot of
+        # this request if this request is what assigned them.
+        matching = self.matching
+        if matching is None:
+            matching = self.matching = Matching(
+                [tuple(simulator._get_resource(o) for o in options)
+                 for options in self.unassigned],
+                simulator._available
+            )
+
+        # Try and assign as much as possible of what is requested. Slots
+        # that are filled already may move to other options along the way,
+        # but they stay filled, so the process only ever gets more.
+        for slot, node in enumerate(matching.nodes):
+            if node is not None:
+                continue
+
+            path = matching.augment(slot)
+            if path is not None:
+                self._take(simulator, path[-1][1])
+
+        self.unassigned = [
+            options
+            for options, node in zip(matching.options, matching.nodes)
+            if node is None
+        ]
+        if self.unassigned:
+            return False
 
-            # Allow is_ok to go to False, but keep trying to assing objects.
-            is_ok = is_ok and is_assigned
+        self.stop_time = simulator.clock
+        return True
 
-        self.unassigned = new_unassigned
-        if is_ok:
-            self.stop_time = simulator.clock
-        return is_ok
+    def _take(self, simulator, resource):
+        '''Assigns a free resource to the process.'''
+        # Pools hand out whichever of their units is free.
+        if isinstance(resource, Pool):
+            resource = simulator.assign_unit(self, resource)
+        else:
+            simulator.assign(self, resource)
+        self.assigned.append(resource)
+
+    def waits_on(self, simulator):
+        '''
+        A blocked request waits on everything it still needs. If its own
+        process is assigned to someone else, it cannot be given anything
+        until that process is released, so it waits on that alone.
+        '''
+        if self.event_gen in simulator.assigned:
+            return [self.event_gen]
+
+        resources = []
+        for request_options in self.unassigned:
+            for option in request_options:
+                resources.append(simulator._get_resource(option))
+        return resources
 
 
 class HoldEvent(Event):
@@ -184,11 +272,16 @@ class HoldEvent(Event):
     One thing to note is that a process that is currently assigned to
     another process cannot enter a hold phase until it is released.
     '''
+    __slots__ = ('hold',)
     EVENT_TYPE = 'hold'
+    PRIORITY = 0
 
     def __init__(self, *args, **kwds):
-        super(HoldEvent, self).__init__(HoldEvent.EVENT_TYPE, *args)
-        self.event_args = kwds['event_args']
+        super().__init__(
+            HoldEvent.EVENT_TYPE,
+            *args,
+            event_args=kwds['event_args']
+        )
 
         # Generate the time for hold.
         func = self.event_args[0]
@@ -218,6 +311,15 @@ class HoldEvent(Event):
             self.stop_time = simulator.clock
             return True
 
+    def waits_on(self, simulator):
+        '''
+        A hold that cannot start waits for its own process to be released.
+        Once started, it is only waiting for time to pass.
+        '''
+        if self.start_time is None:
+            return [self.event_gen]
+        return None
+
 
 class ReleaseEvent(Event):
     '''
@@ -234,56 +336,62 @@ class ReleaseEvent(Event):
 
             yield chute.release, servers, servers, 'manager'
 
+    Releasing a Pool releases any one unit of it held by the process.
+
     A process will only release resources it is currently assigned.
     '''
+    __slots__ = ()
     EVENT_TYPE = 'release'
 
     def __init__(self, *args, **kwds):
-        super(ReleaseEvent, self).__init__(ReleaseEvent.EVENT_TYPE, *args)
-        self.event_args = kwds['event_args']
-
-    def _find_order(self, assigned, release_tuples, order=[]):
-        '''Finds the first feasible order of resources to release.'''
-        try:
-            release_tup = release_tuples[0]
-        except IndexError:
-            return order
-
-        # Use backtracking to build a list of items to release that
-        # will satisfy all the release arguments, if such a list exists.
-        for to_release in release_tup:
-            if to_release in assigned:
-                new_assigned = set(assigned)
-                new_assigned.remove(to_release)
-                new_order = self._find_order(
-                    new_assigned,
-                    release_tuples[1:],
-                    order + [to_release]
-                )
-
-                if new_order is not False:
-                    return new_order
+        super().__init__(
+            ReleaseEvent.EVENT_TYPE,
+            *args,
+            event_args=kwds['event_args']
+        )
 
-        return False
+    def _candidates(self, assigned, options):
+        '''
+        Returns the assigned resources that match any release option, in the
+        order they were assigned.
+        '''
+        options = set(options)
+        pools = set(o for o in options if isinstance(o, Pool))
+
+        candidates = []
+        for resource in assigned:
+            if resource in options or (
+                    isinstance(resource, Unit) and resource.pool in pools):
+                candidates.append(resource)
+        return candidates
+
+    def _find_order(self, release_tuples):
+        '''
+        Finds resources to release, one for each release argument and no
+        resource twice, or returns False if there is no way to do that.
+        '''
+        matching = Matching(release_tuples)
+        for slot in range(len(release_tuples)):
+            if matching.augment(slot) is None:
+                return False
+        return matching.nodes
 
     def stop(self, simulator):
         '''Release .'''
         if simulator.clock < self.clock:  # Sanity check.
             return False
 
-        assigned = set(simulator.resources(self))
+        assigned = simulator.resources(self)
 
         if self.event_args:
             release_tuples = []
             for e in self.event_args:
                 if type(e) not in (list, tuple):
-                    e = assigned.intersection(set([e]))
-                else:
-                    e = assigned.intersection(set(e))
-                release_tuples.append(e)
+                    e = (e,)
+                release_tuples.append(self._candidates(assigned, e))
 
             # Find an order of resources to remove to satisfy release criteria.
-            order = self._find_order(simulator.resources(self), release_tuples)
+            order = self._find_order(release_tuples)
             if order:
                 for o in order:
                     simulator.release(self, o)
@@ -294,7 +402,7 @@ class ReleaseEvent(Event):
 
         else:
             # Nothing released specifically, so release everything.
-            for to_release in assigned:
+            for to_release in list(assigned):
                 simulator.release(self, to_release)
             self.stop_time = simulator.clock
             return True
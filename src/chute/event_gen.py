@@ -1,17 +1,33 @@
+from chute import dist
 from chute.event import CreateEvent
+from chute.trace import Trace
 
 
 class EventGenerator(object):
-    def __init__(self, simulator, clock=0):
+    # Event generators step through their events with a plain method rather
+    # than a Python generator. A generator's frame would refer back to the
+    # event generator, and that cycle keeps finished processes around until
+    # the garbage collector finds them, instead of freeing them right away.
+    __slots__ = 'simulator', 'clock', 'random', '_next', '_done'
+
+    def __init__(self, simulator, clock=0, rng=None):
         self.simulator = simulator
         self.clock = clock
-        self._iter = iter(self)
+        self.random = rng  # Random stream, or None for the random module.
         self._next = None
         self._done = False
 
     def __lt__(self, other):
         return self.peek < other.peek
 
+    def _step(self):
+        '''Returns the next event, or raises StopIteration if there is none.'''
+        raise StopIteration
+
+    def _finish(self):
+        '''Called once there are no more events.'''
+        pass
+
     @property
     def done(self):
         return self._done
@@ -19,54 +35,62 @@ class EventGenerator(object):
     @property
     def peek(self):
         if self._next is None:
-            if hasattr(self._iter, 'next'):
-                self._next = self._iter.next()  # Python 2
-            else:
-                self._next = next(self._iter)   # Python 3
+            if self.random is not None:
+                dist.use(self.random)
+            self._next = self._step()
 
         return self._next
 
     @property
     def next(self):
         n = self._next
+        if self.random is not None:
+            dist.use(self.random)
         try:
-            # This is for Python 2 vs, Python 3.
-            try:
-                self._next = self._iter.next()  # Python 2
-            except AttributeError:
-                self._next = next(self._iter)   # Python 3
+            self._next = self._step()
 
         except StopIteration:
             self._next = None
             self._done = True
+            self._finish()
 
         return n
 
 
 class CreateEventGenerator(EventGenerator):
+    __slots__ = 'process', 'interarrival', 'num'
+
     def __init__(self, simulator, process, interarrival, clock=0):
         '''
         A generator of create events. These events add actors to the simulation
         which are modeled by calling either a function or a class.
 
             - process: generator of events that execute the actor's process
-            - interarrival: lambda that generates interarrival times
+            - interarrival: lambda that generates interarrival times, or a
+              Trace to replay from the start
             - clock: time to start the CreateGenerator (default=0)
         '''
+        if isinstance(interarrival, Trace):
+            interarrival = interarrival.interarrivals()
         self.process = process
         self.interarrival = interarrival
         self.num = 0
-        super(CreateEventGenerator, self).__init__(simulator, clock)
+        super().__init__(
+            simulator,
+            clock,
+            simulator.stream(process.__name__, 'arrivals')
+        )
 
-    def __iter__(self):
-        while True:
-            self.clock += self.interarrival()
-            e = CreateEvent(self, self.clock, self.process, self.num)
-            self.num += 1
-            yield e
+    def _step(self):
+        self.clock += self.interarrival()
+        e = CreateEvent(self, self.clock, self.process, self.num)
+        self.num += 1
+        return e
 
 
 class ProcessEventGenerator(EventGenerator):
+    __slots__ = 'create_event', '_process', '_last'
+
     def __init__(self, simulator, create_event):
         '''
         A generator of events for a process running in the system. This
@@ -79,35 +103,37 @@ class ProcessEventGenerator(EventGenerator):
             self._process = iter(create_event.process()())
         else:
             self._process = iter(create_event.process())
-        super(ProcessEventGenerator, self).__init__(
+        if simulator.profile is not None:
+            self._process = simulator.profile.timed_process(self._process)
+        self._last = create_event
+        super().__init__(
             simulator,
-            create_event.clock
+            create_event.clock,
+            simulator.stream(create_event.process_name, 'process')
+        )
+
+    def _step(self):
+        # Once the process is out of events, StopIteration finishes this
+        # generator too.
+        args = next(self._process)
+
+        # If not a tuple, force it to be a tuple of length 1.
+        if not isinstance(args, tuple):
+            args = (args,)
+
+        # Always use the stop time of the last event as the sent time of
+        # the next one. By the time this is called, it has been processed.
+        e = args[0](
+            self,
+            self._last.stop_time,
+            self.create_event.process,
+            self.create_event.process_instance,
+            event_args=args[1:]
         )
+        self._last = e
+        return e
 
-    def __iter__(self):
-        # Always use the stop time of the last event as the
-        # sent time of the next event.
-        last_event = self.create_event
-
-        while True:
-            # This is for Python 2 vs, Python 3.
-            if hasattr(self._process, 'next'):
-                args = self._process.next()  # Python 2
-            else:
-                args = next(self._process)   # Python 3
-
-            # If not a tuple, force it to be a tuple of length 1.
-            if not isinstance(args, tuple):
-                args = (args,)
-
-            e = args[0](
-                self,
-                last_event.stop_time,
-                self.create_event.process,
-                self.create_event.process_instance,
-                event_args=args[1:]
-            )
-            yield e
-
-            # By the next iteration, e will have a stop_time.
-            last_event = e
+    def _finish(self):
+        # The last event refers back to this generator, so let it go.
+        self._last = None
+        self._process = None
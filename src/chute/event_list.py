@@ -0,0 +1,116 @@
+'''
+Future event lists. The simulator keeps each event generator that is not
+blocked in one of these, keyed by the time, priority and sequence number of
+its next event. Holds have priority over other events at the same time, and
+events with the same time and priority come out in the order they went in.
+
+Entries are tuples of (clock, priority, sequence, event generator). Since
+sequence numbers are unique, entries never compare their generators.
+'''
+from bisect import insort
+import heapq
+
+
+class HeapEventList(object):
+    '''A binary heap of entries. This is the default.'''
+    def __init__(self):
+        self.entries = []
+
+    def push(self, entry):
+        heapq.heappush(self.entries, entry)
+
+    def pop(self):
+        '''Removes and returns the earliest entry, or raises IndexError.'''
+        return heapq.heappop(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class CalendarEventList(object):
+    '''
+    A calendar queue (R. Brown, 1988). Entries are spread over buckets by
+    time like days on a calendar, so pushing and popping take constant time
+    on average no matter how many entries there are. The number of buckets
+    and their width adapt as the list grows and shrinks.
+    '''
+    def __init__(self, buckets=16, width=1.0):
+        self.size = 0
+        self._setup(buckets, width, 0.0)
+
+    def _setup(self, buckets, width, clock):
+        self.buckets = [[] for _ in range(buckets)]
+        self.width = width
+        self.day = int(clock / width)  # Bucket number of the current day.
+
+        # Resize when there are twice as many entries as buckets, or half.
+        self.grow = 2 * buckets
+        self.shrink = buckets // 2 if buckets > 16 else -1
+
+    def push(self, entry):
+        day = int(entry[0] / self.width)
+        insort(self.buckets[day % len(self.buckets)], entry)
+        if day < self.day:
+            self.day = day  # Entries can be pushed for earlier times.
+
+        self.size += 1
+        if self.size > self.grow:
+            self._resize(2 * len(self.buckets))
+
+    def pop(self):
+        '''Removes and returns the earliest entry, or raises IndexError.'''
+        if not self.size:
+            raise IndexError('pop from empty event list')
+
+        # Look through a year of days, starting with the current one, for an
+        # entry that falls on the day its bucket is being looked at for.
+        buckets = self.buckets
+        width = self.width
+        day = self.day
+        for _ in range(len(buckets)):
+            bucket = buckets[day % len(buckets)]
+            if bucket and int(bucket[0][0] / width) <= day:
+                return self._take(bucket, day)
+            day += 1
+
+        # Nothing for a whole year, so jump straight to the earliest entry.
+        entry = min(bucket[0] for bucket in buckets if bucket)
+        day = int(entry[0] / width)
+        return self._take(buckets[day % len(buckets)], day)
+
+    def _take(self, bucket, day):
+        entry = bucket.pop(0)
+        self.day = day
+        self.size -= 1
+        if self.size < self.shrink:
+            self._resize(len(self.buckets) // 2)
+        return entry
+
+    def _resize(self, buckets):
+        '''Spreads the entries over a new number of buckets.'''
+        entries = [entry for bucket in self.buckets for entry in bucket]
+
+        # Make buckets about three times the average gap between the entries
+        # due next, which keeps a few entries in each bucket.
+        earliest = heapq.nsmallest(min(len(entries), 32), entries)
+        width = self.width
+        if len(earliest) > 1:
+            gap = (earliest[-1][0] - earliest[0][0]) / (len(earliest) - 1)
+            if gap > 0:
+                width = 3.0 * gap
+
+        clock = earliest[0][0] if earliest else self.day * self.width
+        self._setup(buckets, width, clock)
+        for entry in entries:
+            day = int(entry[0] / width)
+            insort(self.buckets[day % buckets], entry)
+
+    def __len__(self):
+        return self.size
+
+
+# Event lists by name.
+EVENT_LISTS = {
+    'heap':     HeapEventList,
+    'calendar': CalendarEventList,
+}
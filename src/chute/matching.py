@@ -0,0 +1,77 @@
+'''
+Matching of request and release arguments to resources. Each argument is a
+slot that needs one resource out of a tuple of options, and no resource can
+fill more than one slot, except that a Pool can fill as many as it has free
+units. Slots are filled one at a time along augmenting paths (Kuhn's
+algorithm): if none of a slot's options is free, a slot holding one of them
+moves to another option to make room, and so on. If any way of filling the
+slot exists, this finds it, and filling n slots takes O(n * options) steps
+instead of trying every combination.
+
+Free options are always tried first and in order, so slots get the same
+resources as simply taking the first free option whenever that works.
+'''
+
+
+class Matching(object):
+    '''
+    Fills slots with nodes. Parameters:
+
+        - options: list with a tuple of nodes in order of preference for
+          each slot
+        - free (default=None): function that returns True if a node can
+          fill another slot. By default, nodes can fill one slot each.
+    '''
+    def __init__(self, options, free=None):
+        self.options = options
+        self.free = free or (lambda node: node not in self.owners)
+        self.nodes = [None] * len(options)  # Slot -> node filling it.
+        self.owners = {}                    # Node -> slots it fills.
+
+    def augment(self, slot):
+        '''
+        Fills an empty slot. Returns the path used, as a list of (slot, node)
+        pairs, in which each slot after the first has moved off the node
+        taken by the slot before it, and the last node was free. Returns None
+        if the slot cannot be filled right now.
+        '''
+        # Most of the time an option is free, and there is no path to find.
+        free = self.free
+        for node in self.options[slot]:
+            if free(node):
+                path = [(slot, node)]
+                break
+        else:
+            path = self._path(slot, set())
+            if path is None:
+                return None
+
+        for s, node in path:
+            old = self.nodes[s]
+            if old is not None:
+                self.owners[old].remove(s)
+                if not self.owners[old]:
+                    del self.owners[old]
+            self.nodes[s] = node
+            self.owners.setdefault(node, []).append(s)
+        return path
+
+    def _path(self, slot, visited):
+        options = [n for n in self.options[slot] if n not in visited]
+
+        for node in options:
+            if self.free(node):
+                return [(slot, node)]
+
+        for node in options:
+            if node in visited:
+                continue
+            visited.add(node)
+            for other in list(self.owners.get(node, ())):
+                if other == slot:
+                    continue
+                path = self._path(other, visited)
+                if path is not None:
+                    return [(slot, node)] + path
+
+        return None
@@ -0,0 +1,151 @@
+'''
+Output files written in the background. Sinks write a small piece of text
+or bytes for every event, and when each write goes straight to a pipe or a
+network filesystem, the simulation waits on it. A BackgroundWriter collects
+writes into large chunks instead, and a thread of its own writes them out
+and compresses them, so the simulation only waits when it gets far ahead of
+the disk.
+
+open_output picks compression by file name:
+
+    - .gz:   gzip
+    - .xz:   xz (LZMA)
+    - .bz2:  bzip2
+    - anything else is written as is
+
+A compressed file is one stream, so only one process can write to it. The
+branches of a Simulator snapshot should write somewhere else.
+'''
+import bz2
+import gzip
+import lzma
+import os
+import queue
+import threading
+
+# How to open a file for writing bytes, by extension.
+OPENERS = {
+    '.gz':  lambda filename: gzip.open(filename, 'wb', compresslevel=6),
+    '.xz':  lambda filename: lzma.open(filename, 'wb'),
+    '.bz2': lambda filename: bz2.open(filename, 'wb'),
+}
+
+
+def open_output(filename, binary=False, chunk_size=1 << 20):
+    '''
+    Opens a file to write output to in the background, compressed according
+    to its extension. It takes str unless binary is True, in which case it
+    takes bytes.
+    '''
+    opener = OPENERS.get(os.path.splitext(filename)[1].lower())
+    raw = opener(filename) if opener else open(filename, 'wb')
+    return BackgroundWriter(raw, binary, chunk_size)
+
+
+class BackgroundWriter(object):
+    '''
+    A file-like object that writes to raw, a binary file, in a background
+    thread. Parameters:
+
+        - raw: binary file to write to, which is closed along with this
+        - binary (default=False): take bytes instead of str, which is
+          encoded as UTF-8
+        - chunk_size (default=1MB): size of the chunks handed to the thread
+        - chunks (default=8): most chunks waiting to be written before
+          writes wait for the thread to catch up
+
+    Errors in the thread are raised by the next write, flush or close.
+    '''
+    def __init__(self, raw, binary=False, chunk_size=1 << 20, chunks=8):
+        self.raw = raw
+        self.binary = binary
+        self.chunk_size = chunk_size
+        self.chunks = chunks
+        self.closed = False
+
+        self._parts = []
+        self._size = 0
+        self._error = None
+        self._start()
+
+    def _start(self):
+        self._pid = os.getpid()
+        self._queue = queue.Queue(self.chunks)
+        self._thread = threading.Thread(target=self._write_chunks)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _write_chunks(self):
+        while True:
+            chunk = self._queue.get()
+            try:
+                if chunk is None:
+                    return
+                if self._error is None:
+                    if not self.binary:
+                        chunk = chunk.encode('utf-8')
+                    self.raw.write(chunk)
+            except Exception as e:
+                self._error = e
+            finally:
+                self._queue.task_done()
+
+    def _check(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def _hand_off(self):
+        '''Hands whatever has been written so far to the thread.'''
+        if not self._parts:
+            return
+
+        # A forked child, such as a snapshot, does not have the thread.
+        if self._pid != os.getpid():
+            self._start()
+
+        joiner = b'' if self.binary else ''
+        self._queue.put(joiner.join(self._parts))
+        self._parts = []
+        self._size = 0
+
+    def write(self, data):
+        if self.closed:
+            raise ValueError('write to closed file')
+        self._parts.append(data)
+        self._size += len(data)
+        if self._size >= self.chunk_size:
+            self._check()
+            self._hand_off()
+        return len(data)
+
+    def writable(self):
+        return True
+
+    def flush(self):
+        '''Waits until everything written so far is in the file.'''
+        if self.closed:
+            return
+        self._hand_off()
+        if self._pid == os.getpid():
+            self._queue.join()
+        self._check()
+        self.raw.flush()
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            self.flush()
+        finally:
+            self.closed = True
+            if self._pid == os.getpid():
+                self._queue.put(None)
+                self._thread.join()
+            self.raw.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,423 @@
+'''
+Partitioned simulation. Large models often have groups of processes that
+never request each other's resources, like separate service lines that
+share nothing. Groups like that cannot affect one another, so each one can
+be simulated in a process of its own, on a core of its own, and their events
+merged back together by time. With a seed, every process draws from random
+streams of its own, so it does the same thing whether it is simulated with
+its group alone or alongside everything else.
+
+Groups are found from the resources each process requests. A process can
+declare those when it is registered:
+
+    @chute.process(chute.dist.exponential(.5), resources=['server 1'])
+    def customer():
+        yield chute.request, 'server 1'
+        yield chute.hold, chute.dist.exponential(.75)
+        yield chute.release
+
+Processes that do not are watched while the whole model is simulated for a
+short probe period first. Processes that request other processes are grouped
+with them, which only the probe finds out. Once the simulation is over, each
+group reports what its processes requested, and if two groups turn out to
+share anything after all, a ValueError says so.
+
+Partitioning uses os.fork, so it is only available on Unix. Events at the
+same time in different groups come out in group order. Processes that affect
+each other in other ways, such as through global variables or the random
+module, should not be partitioned.
+'''
+from chute.resource import Unit, describe
+from chute.runner import load_models
+from chute.simulator import Simulator
+from chute.sink import (
+    BINARY_FORMATS,
+    FilterSink,
+    NullSink,
+    Sink,
+    create as create_sink
+)
+from chute.stats import Statistics
+import heapq
+import io
+import multiprocessing
+import os
+import signal
+import sys
+
+# Statistics come out in this order, and sorted by name within each one.
+_STATISTICS = (
+    'utilization',
+    'busy_instances',
+    'queue_length',
+    'wait',
+    'hold',
+    'sojourn'
+)
+
+
+def _name(resource):
+    '''What a resource is known by, the same way in every process.'''
+    create_event = getattr(resource, 'create_event', None)
+    if create_event is not None:
+        return 'process', create_event.process_name
+    if isinstance(resource, Unit):
+        resource = resource.pool
+    return 'resource', describe(resource)
+
+
+def _requested(simulator, event):
+    '''The names of everything a request asks for, as options or not.'''
+    names = set()
+    for options in event.event_args:
+        if type(options) not in (list, tuple):
+            options = (options,)
+        for option in options:
+            names.add(_name(simulator._get_resource(option)))
+    return names
+
+
+class _Requests(object):
+    '''
+    Collects what each process requests. It watches a simulator through the
+    same hooks as chute.stats.Statistics, so it sees requests that are
+    blocked as well as those that are granted.
+    '''
+    def __init__(self):
+        self.requested = {}  # Process name -> set of resource names.
+
+    def blocked(self, simulator, event):
+        if event.event_type == 'request':
+            self.requested.setdefault(event.process_name, set()).update(
+                _requested(simulator, event)
+            )
+
+    processed = blocked
+
+    def assigned(self, simulator, resource):
+        pass
+
+    def released(self, simulator, resource):
+        pass
+
+    def reset(self, simulator, clock=None):
+        pass
+
+
+def groups(registry, probe=0, num=0, seed=None):
+    '''
+    Splits the processes in a registry into groups that never request each
+    other's resources. Returns the names of the processes in each group, in
+    registry order. Processes that do not declare their resources are
+    watched while the registry is simulated for probe time, as simulation
+    num with seed, which runs the models' code.
+    '''
+    requested = {}
+    for process in registry:
+        declared = getattr(process, '_chute_resources', None)
+        if declared is not None:
+            requested[process.__name__] = set(_name(r) for r in declared)
+
+    undeclared = [p.__name__ for p in registry if p.__name__ not in requested]
+    if undeclared:
+        if probe <= 0:
+            raise ValueError(
+                '%s must declare resources to be partitioned without a '
+                'probe' % ', '.join(undeclared)
+            )
+        requests = _Requests()
+        simulator = Simulator(
+            num,
+            seed=seed,
+            sink=NullSink(),
+            stats=requests,
+            registry=registry
+        )
+        simulator.run(probe)
+        for name, names in requests.requested.items():
+            requested.setdefault(name, set()).update(names)
+
+    # Processes that request the same thing end up with the same root.
+    parent = dict((p.__name__, p.__name__) for p in registry)
+
+    def root(name):
+        while parent[name] != name:
+            parent[name] = parent[parent[name]]
+            name = parent[name]
+        return name
+
+    owners = {}  # Resource name -> a process that requests it.
+    for name in parent:
+        for resource in requested.get(name, set()) | {('process', name)}:
+            parent[root(name)] = root(owners.setdefault(resource, name))
+
+    found = {}
+    for name in parent:
+        found.setdefault(root(name), []).append(name)
+    return list(found.values())
+
+
+class _Lines(Sink):
+    '''
+    Sends the output of each event to the parent process in batches, as
+    tuples of (clock, group, sequence number, text) that sort in the order
+    the events happened. Also collects what the processes request.
+    '''
+    def __init__(self, group, sink, buffer, conn, batch=1024):
+        self.group = group
+        self.sink = sink
+        self.buffer = buffer
+        self.conn = conn
+        self.batch = batch
+        self.header = ''
+        self.lines = []  # (clock, where its text ends in the buffer).
+        self.end = 0
+        self.sequence = 0
+        self.requested = set()
+        self.seen = set()  # Resources whose names are in requested.
+
+    def open(self, simulator):
+        self.sink.open(simulator)
+        self.header = self.buffer.getvalue()
+        self.buffer.seek(0)
+        self.buffer.truncate()
+
+    def _observe(self, simulator, event):
+        for options in event.event_args:
+            if type(options) not in (list, tuple):
+                options = (options,)
+            for option in options:
+                resource = simulator._get_resource(option)
+                if resource in self.seen:
+                    continue
+                name = _name(resource)
+                self.requested.add(name)
+                if name[0] == 'resource':  # Processes come and go.
+                    self.seen.add(resource)
+
+    def emit(self, simulator, event):
+        if event.event_type == 'request':
+            self._observe(simulator, event)
+
+        self.sink.emit(simulator, event)
+        end = self.buffer.tell()
+        if end > self.end:
+            self.end = end
+            self.lines.append((simulator.clock, end))
+            if len(self.lines) >= self.batch:
+                self.flush()
+
+    def close(self, simulator):
+        self.sink.close(simulator)
+        self.flush()
+
+    def flush(self):
+        if not self.lines:
+            return
+
+        text = self.buffer.getvalue()
+        self.buffer.seek(0)
+        self.buffer.truncate()
+
+        lines = []
+        start = 0
+        for clock, end in self.lines:
+            self.sequence += 1
+            lines.append((clock, self.group, self.sequence, text[start:end]))
+            start = end
+        self.conn.send(('lines', lines))
+        self.lines = []
+        self.end = 0
+
+
+def _sync(simulator, conn):
+    '''
+    Tells the parent where a group stopped, and returns where the clock of
+    the whole simulation would be.
+    '''
+    conn.send(('clock', simulator.clock, len(simulator.events) > 0))
+    return conn.recv()
+
+
+def _simulate(group, registry, conn, num, time, fmt, seed, stats, warmup,
+              watchdog, event_filter):
+    '''Simulates one group in a child process. Never returns.'''
+    status = 0
+    try:
+        try:
+            buffer = io.StringIO()
+            sink = create_sink(fmt, buffer)
+            if event_filter is not None:
+                sink = FilterSink(sink, event_filter)
+            lines = _Lines(group, sink, buffer, conn)
+
+            simulator = Simulator(
+                num,
+                seed=seed,
+                sink=lines,
+                stats=Statistics() if stats else None,
+                watchdog=watchdog,
+                registry=registry
+            )
+            simulator.start()
+            conn.send(('start', lines.header))
+
+            # Statistics start over when the whole simulation is past the
+            # warm-up, which can be before this group is.
+            if warmup:
+                simulator.run(warmup, warmup)
+                clock = _sync(simulator, conn)
+                if stats and clock >= warmup:
+                    simulator.stats.reset(simulator, clock)
+
+            simulator.run(time, warmup)
+            clock = _sync(simulator, conn)
+
+            rows = None
+            if stats:
+                rows = simulator.stats.summary(simulator, clock)
+            sys.stdout.flush()
+            conn.send(('done', rows, simulator.diagnostic, lines.requested))
+        except Exception as e:
+            conn.send(('error', e))
+    except BaseException:
+        status = 1
+    finally:
+        os._exit(status)
+
+
+class _Group(object):
+    '''A child process simulating a group, seen from the parent.'''
+    def __init__(self, group, registry, others, kwds):
+        self.group = group
+        self.stopped = None  # Where the group stopped, and if it has more.
+        self.conn, child = multiprocessing.Pipe()
+
+        self.pid = os.fork()
+        if not self.pid:
+            self.conn.close()
+            for other in others:
+                other.conn.close()
+            _simulate(group, registry, child, **kwds)
+        child.close()
+
+    def recv(self):
+        try:
+            message = self.conn.recv()
+        except EOFError:
+            raise RuntimeError('group %d crashed' % self.group)
+        if message[0] == 'error':
+            raise message[1]
+        return message
+
+    def lines(self):
+        '''Yields the group's events until it stops to sync its clock.'''
+        while True:
+            message = self.recv()
+            if message[0] != 'lines':
+                self.stopped = message[1:]
+                return
+            for line in message[1]:
+                yield line
+
+    def close(self, kill=False):
+        if kill:
+            os.kill(self.pid, signal.SIGKILL)
+        self.conn.close()
+        os.waitpid(self.pid, 0)
+
+
+def _set_clock(children):
+    '''
+    Works out where the clock of the whole simulation would be from where
+    each group stopped, and tells every group.
+    '''
+    ahead = [clock for clock, more in (c.stopped for c in children) if more]
+    if ahead:
+        clock = min(ahead)
+    else:
+        clock = max(clock for clock, _ in (c.stopped for c in children))
+    for child in children:
+        child.conn.send(clock)
+
+
+def replicate(code, found, num, time, out=sys.stdout, fmt='csv', seed=None,
+              stats=False, warmup=0, watchdog=None, params=None,
+              event_filter=None):
+    '''
+    Runs a replication like chute.runner.replicate, but simulates each group
+    of processes in found, as returned by groups, in a child process of its
+    own. Returns a tuple of its summary rows, or None if stats is False, and
+    the diagnostic left by the watchdog of the first group it stopped, or
+    None. Raises OSError where os.fork is not available.
+    '''
+    if not hasattr(os, 'fork'):
+        raise OSError('partitioning needs os.fork, which is only on Unix')
+    if fmt in BINARY_FORMATS:
+        raise ValueError('partitioned output cannot be %s' % fmt)
+
+    # Every group starts from the same freshly loaded models.
+    registry = load_models(code, params)
+    kwds = {
+        'num':          num,
+        'time':         time,
+        'fmt':          fmt,
+        'seed':         seed,
+        'stats':        stats,
+        'warmup':       warmup,
+        'watchdog':     watchdog,
+        'event_filter': event_filter
+    }
+
+    # Anything still buffered would be written by the children as well.
+    out.flush()
+    sys.stdout.flush()
+    sys.stderr.flush()
+
+    children = []
+    finished = False
+    try:
+        for group, names in enumerate(found):
+            processes = dict(
+                (p, i) for p, i in registry.items() if p.__name__ in names
+            )
+            children.append(_Group(group, processes, children, kwds))
+
+        # Every group writes the same header, if the format has one.
+        headers = [child.recv()[1] for child in children]
+        out.write(headers[0])
+
+        if warmup:
+            for child in children:
+                child.stopped = child.recv()[1:]
+            _set_clock(children)
+
+        merged = heapq.merge(*(child.lines() for child in children))
+        for _, _, _, text in merged:
+            out.write(text)
+        _set_clock(children)
+
+        results = [child.recv()[1:] for child in children]
+        finished = True
+    finally:
+        for child in children:
+            child.close(kill=not finished)
+
+    # Groups that share a resource would have waited on each other.
+    owners = {}
+    for group, (_, _, requested) in enumerate(results):
+        for name in requested:
+            other = owners.setdefault(name, group)
+            if other != group:
+                raise ValueError(
+                    'groups %d and %d both requested %s, so they cannot be '
+                    'partitioned this way' % (other, group, name[1])
+                )
+
+    rows = None
+    if stats:
+        rows = [row for r, _, _ in results for row in r]
+        rows.sort(key=lambda row: (_STATISTICS.index(row[1]), row[2]))
+
+    diagnostics = [d for _, d, _ in results if d is not None]
+    return rows, diagnostics[0] if diagnostics else None
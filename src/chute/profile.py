@@ -0,0 +1,166 @@
+'''
+Engine profiling. Pass a Profile to a Simulator to count and time what it
+does while it runs. Its summary is a list of rows in PROFILE_FIELDS order:
+
+    - processed:   events processed, by event type
+    - retried:     attempts to process events that were blocked, by event
+                   type
+    - failed:      requests that could not get a resource, by resource,
+                   or by process name for processes requested as resources
+    - event_list:  pushes and pops on the future event list
+    - time:        time spent running the processes' own code (model),
+                   in the sink writing output (sink), on the future event
+                   list (event_list), and everywhere else in the simulator
+                   (engine), out of the total time spent running
+
+Profiling costs a little time itself, which is counted as engine time. The
+simulator does nothing extra when it has no Profile.
+'''
+from chute.resource import summary_name
+from timeit import default_timer
+
+PROFILE_FIELDS = (
+    'simulation',  # Simulation number.
+    'category',    # What was counted (processed, time, etc.).
+    'name',        # Event type, resource, or part of the simulator.
+    'count',       # Number of times it happened.
+    'seconds'      # Time it took, if timed.
+)
+
+
+class Profile(object):
+    '''Counts and times the work a simulator does.'''
+    def __init__(self):
+        self.counts = {}  # (category, name) -> [count, seconds or None].
+        self.total = 0.0
+        self.started = None
+
+    def _add(self, category, name, seconds=None):
+        try:
+            count = self.counts[category, name]
+        except KeyError:
+            count = self.counts[category, name] = [
+                0,
+                None if seconds is None else 0.0
+            ]
+        count[0] += 1
+        if seconds is not None:
+            count[1] += seconds
+
+    def blocked(self, simulator, event):
+        '''Called each time an event cannot be processed yet.'''
+        self._add('retried', event.event_type)
+        if event.event_type == 'request':
+            for request_options in event.unassigned:
+                for option in request_options:
+                    resource = simulator._get_resource(option)
+                    self._add('failed', summary_name(simulator, resource))
+
+    def processed(self, simulator, event):
+        '''Called with each event once it has been processed.'''
+        self._add('processed', event.event_type)
+
+    def timed_events(self, events):
+        '''Wraps a future event list to time pushes and pops.'''
+        return _TimedEventList(self, events)
+
+    def timed_sink(self, sink):
+        '''Wraps a sink to time its output.'''
+        return _TimedSink(self, sink)
+
+    def timed_process(self, process):
+        '''Wraps the iterator of a process to time its code.'''
+        return _TimedProcess(self, process)
+
+    def start(self, simulator):
+        '''Called when a simulator starts running.'''
+        self.started = default_timer()
+
+    def stop(self, simulator):
+        '''Called when a simulator stops running.'''
+        self.total += default_timer() - self.started
+
+    def summary(self, simulator):
+        '''Returns rows of everything counted so far, in PROFILE_FIELDS.'''
+        rows = []
+        for category in ('processed', 'retried', 'failed', 'event_list'):
+            for (c, name), (count, seconds) in sorted(self.counts.items()):
+                if c == category:
+                    rows.append((simulator.num, c, name, count, seconds))
+
+        model, sink, push, pop = (
+            self.counts.get(key, (0, 0.0)) for key in (
+                ('time', 'model'),
+                ('time', 'sink'),
+                ('event_list', 'push'),
+                ('event_list', 'pop')
+            )
+        )
+
+        # Whatever is not accounted for is the simulator's own work.
+        event_list = push[1] + pop[1]
+        engine = max(self.total - model[1] - sink[1] - event_list, 0.0)
+        rows.extend([
+            (simulator.num, 'time', 'model', model[0], model[1]),
+            (simulator.num, 'time', 'sink', sink[0], sink[1]),
+            (simulator.num, 'time', 'event_list', None, event_list),
+            (simulator.num, 'time', 'engine', None, engine),
+            (simulator.num, 'time', 'total', None, self.total)
+        ])
+        return rows
+
+
+class _TimedEventList(object):
+    def __init__(self, profile, events):
+        self.profile = profile
+        self.events = events
+
+    def push(self, entry):
+        start = default_timer()
+        self.events.push(entry)
+        self.profile._add('event_list', 'push', default_timer() - start)
+
+    def pop(self):
+        start = default_timer()
+        try:
+            return self.events.pop()
+        finally:
+            self.profile._add('event_list', 'pop', default_timer() - start)
+
+    def __len__(self):
+        return len(self.events)
+
+
+class _TimedSink(object):
+    def __init__(self, profile, sink):
+        self.profile = profile
+        self.sink = sink
+
+    def open(self, simulator):
+        self.sink.open(simulator)
+
+    def emit(self, simulator, event):
+        start = default_timer()
+        self.sink.emit(simulator, event)
+        self.profile._add('time', 'sink', default_timer() - start)
+
+    def close(self, simulator):
+        start = default_timer()
+        self.sink.close(simulator)
+        self.profile._add('time', 'sink', default_timer() - start)
+
+
+class _TimedProcess(object):
+    def __init__(self, profile, process):
+        self.profile = profile
+        self.process = process
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        start = default_timer()
+        try:
+            return next(self.process)
+        finally:
+            self.profile._add('time', 'model', default_timer() - start)
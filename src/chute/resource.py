@@ -0,0 +1,96 @@
+class Pool(object):
+    '''
+    A pool of interchangeable resources. Requesting a pool assigns any one
+    of its free units to the process, which is much cheaper than requesting
+    a list of equivalent resources when the pool is large:
+
+        servers = chute.Pool('server', 200)
+
+        @chute.process(chute.dist.exponential(1))
+        def customer():
+            yield chute.request, servers
+            yield chute.hold, chute.dist.exponential(0.25)
+            yield chute.release
+
+    Pools only describe resources. The simulator keeps track of which of
+    their units are free, so the same pool can be used across many runs.
+    '''
+    def __init__(self, name, capacity):
+        self.name = name
+        self.capacity = capacity
+
+    def __len__(self):
+        return self.capacity
+
+    def __repr__(self):
+        return 'Pool(%r, %d)' % (self.name, self.capacity)
+
+    def __str__(self):
+        return str(self.name)
+
+
+class Unit(object):
+    '''A single unit of a Pool, as assigned to a process.'''
+    __slots__ = 'pool', 'index'
+
+    def __init__(self, pool, index):
+        self.pool = pool
+        self.index = index
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, Unit) and
+            self.pool is other.pool and
+            self.index == other.index
+        )
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((id(self.pool), self.index))
+
+    def __repr__(self):
+        return 'Unit(%r, %d)' % (self.pool, self.index)
+
+    def __str__(self):
+        return '%s %d' % (self.pool.name, self.index)
+
+
+def describe(resource):
+    '''Names a resource or process, such as for a diagnostic or profile.'''
+    create_event = getattr(resource, 'create_event', None)
+    if create_event is not None:
+        return '%s %d' % (
+            create_event.process_name,
+            create_event.process_instance
+        )
+    return str(resource)
+
+
+def process_name(simulator, resource):
+    '''
+    The process name of a process requested as a resource, or None if it is
+    not a process. Instances of classes registered as processes count as
+    those processes.
+    '''
+    create_event = getattr(resource, 'create_event', None)
+    if create_event is not None:
+        return create_event.process_name
+    if type(resource) in simulator.registry:
+        return type(resource).__name__
+    return None
+
+
+def summary_name(simulator, resource):
+    '''
+    The name a resource is counted under in summaries. Pool units count as
+    the pool, and processes count together under their process name, since
+    every instance would otherwise be reported, and kept, separately.
+    '''
+    name = process_name(simulator, resource)
+    if name is not None:
+        return name
+    if isinstance(resource, Unit):
+        resource = resource.pool
+    return str(resource)
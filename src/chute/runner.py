@@ -0,0 +1,389 @@
+from chute.profile import PROFILE_FIELDS, Profile
+from chute.simulator import MEMORY_FIELDS, Simulator, registering
+from chute.sink import BINARY_FORMATS
+from chute.stats import (
+    BATCH_FIELDS,
+    SUMMARY_FIELDS,
+    Statistics,
+    batch_means,
+    write_summary
+)
+import io
+import marshal
+import multiprocessing
+import os
+import sys
+import tracemalloc
+import types
+
+# Model code compiled by each worker process in a pool.
+_WORKER = {}
+
+
+def compile_models(models, cache=None):
+    '''
+    Reads and compiles a list of model files so they can be run often. With
+    a cache dict, files that have not changed since they were compiled into
+    it are not read again. Models that are already compiled are passed
+    through as they are.
+    '''
+    code = []
+    for model in models:
+        if isinstance(model, types.CodeType):
+            code.append(model)
+            continue
+        if cache is not None:
+            info = os.stat(model)
+            key = info.st_mtime_ns, info.st_size
+            cached = cache.get(model)
+            if cached is not None and cached[0] == key:
+                code.append(cached[1])
+                continue
+
+        with open(model) as f:
+            code.append(compile(f.read(), model, 'exec'))
+        if cache is not None:
+            cache[model] = key, code[-1]
+    return code
+
+
+def load_models(code, params=None):
+    '''
+    Executes compiled model code in a fresh environment, and returns the
+    processes it registers in a registry of their own, to pass to a
+    Simulator. Running the code again for every replication is cheap, and
+    means no replication sees state the models kept from another one.
+
+    Code compiled for a point of a parameter sweep by chute.sweep needs the
+    dict of parameter values at that point as params.
+    '''
+    processes = {}
+    with registering(processes):
+        for c in code:
+            exec(c, {
+                '__name__':  '__chute__',
+                '__file__':  c.co_filename,
+                '__sweep__': params
+            })
+    return processes
+
+
+def replicate(code, num, time, out=sys.stdout, fmt='csv', seed=None,
+              stats=False, warmup=0, batches=None, memory=False,
+              watchdog=None, profile=False, params=None, event_filter=None,
+              partition=None):
+    '''
+    Loads the models and runs a single replication, numbered num, after a
+    warm-up period of warmup. For a point of a parameter sweep, params are
+    its parameter values. Only the events event_filter keeps, if given, are
+    written to out. With a partition probe time, groups of processes that
+    never share resources are simulated side by side by chute.partition.
+    Returns a tuple of:
+
+        - its summary rows, or None if stats is False. With a number of
+          batches, the replication is split into batches after the warm-up,
+          and the rows of every batch are returned in BATCH_FIELDS order.
+        - a row of memory use in MEMORY_FIELDS order, or None if memory is
+          False
+        - the diagnostic record left by watchdog, a chute.watchdog.Watchdog,
+          if it stopped the replication early, or None
+        - its profile rows in PROFILE_FIELDS order, or None if profile is
+          False
+    '''
+    registry = load_models(code, params)
+    if partition is not None:
+        if batches or memory or profile:
+            raise ValueError(
+                'partition cannot be used with batches, memory or profile'
+            )
+
+        from chute import partition as partitioning
+        found = partitioning.groups(registry, partition, num, seed)
+        if len(found) > 1:
+            rows, diagnostic = partitioning.replicate(
+                code,
+                found,
+                num,
+                time,
+                out,
+                fmt,
+                seed,
+                stats,
+                warmup,
+                watchdog,
+                params,
+                event_filter
+            )
+            return rows, None, diagnostic, None
+
+        # The probe ran the models, so they start over.
+        registry = load_models(code, params)
+
+    simulator = Simulator(
+        num=num,
+        out=out,
+        fmt=fmt,
+        seed=seed,
+        stats=Statistics() if stats or batches else None,
+        watchdog=watchdog,
+        profile=Profile() if profile else None,
+        registry=registry,
+        event_filter=event_filter
+    )
+
+    # Memory is measured from the start of the replication.
+    tracing = memory and not tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.start()
+
+    try:
+        if batches:
+            rows = []
+            for batch_rows in batch_means(simulator, time, batches, warmup):
+                rows.extend(batch_rows)
+        else:
+            simulator.run(time, warmup)
+            rows = None
+            if simulator.stats is not None:
+                rows = simulator.stats.summary(simulator)
+
+        usage = None
+        if memory:
+            usage = simulator.memory()
+            usage = tuple(usage[field] for field in MEMORY_FIELDS)
+
+        profile_rows = None
+        if profile:
+            profile_rows = simulator.profile.summary(simulator)
+
+    finally:
+        if tracing:
+            tracemalloc.stop()
+
+    return rows, usage, simulator.diagnostic, profile_rows
+
+
+def _init_worker(models, kwds):
+    '''Compiles the models once per worker process.'''
+    models = [marshal.loads(m) if isinstance(m, bytes) else m for m in models]
+    _WORKER['code'] = compile_models(models)
+    _WORKER['kwds'] = kwds
+
+
+def _replicate_worker(num):
+    '''Runs one replication in a worker and returns its output and results.'''
+    if _WORKER['kwds']['fmt'] in BINARY_FORMATS:
+        out = io.BytesIO()
+    else:
+        out = io.StringIO()
+
+    results = replicate(_WORKER['code'], num, out=out, **_WORKER['kwds'])
+    return out.getvalue(), results
+
+
+def write_diagnostic(out, diagnostic):
+    '''Writes why a replication was stopped early to out, as one line.'''
+    out.write(
+        'simulation %(simulation)d stopped at %(clock)s by %(reason)s: '
+        '%(processes)s waiting on %(resources)s (%(blocked)d blocked)' % dict(
+            diagnostic,
+            processes=', '.join(diagnostic['processes']) or 'nothing',
+            resources=', '.join(diagnostic['resources']) or 'nothing'
+        )
+    )
+    out.write('\n')
+
+
+def replications(models, num, time, out=sys.stdout, fmt='csv', jobs=1,
+                 seed=None, stats=False, warmup=0, batches=None, memory=False,
+                 watchdog=None, profile=False, event_filter=None, cache=None,
+                 partition=None):
+    '''
+    Runs replications 0 to num-1 of a list of model files or compiled model
+    code, writing their output to out in order. Yields the results of each
+    replication as it finishes, as returned by replicate. Closing the
+    generator early stops any replications that are still running. The
+    models are compiled with cache, as in compile_models, unless they run
+    on a pool.
+
+    With more than one job, replications are spread over a pool of worker
+    processes. Since every replication derives its random streams from the
+    seed and its own number, seeded output is the same for any number of
+    jobs.
+    '''
+    # With nowhere to write events to, none are built.
+    if out is None:
+        out, fmt = io.StringIO(), 'null'
+
+    kwds = {
+        'time':         time,
+        'fmt':          fmt,
+        'seed':         seed,
+        'stats':        stats,
+        'warmup':       warmup,
+        'batches':      batches,
+        'memory':       memory,
+        'watchdog':     watchdog,
+        'profile':      profile,
+        'event_filter': event_filter,
+        'partition':    partition
+    }
+
+    if jobs <= 1:
+        code = compile_models(models, cache)
+        for n in range(num):
+            yield replicate(code, n, out=out, **kwds)
+        return
+
+    if fmt in BINARY_FORMATS:
+        out = getattr(out, 'buffer', out)
+
+    # Code objects cannot be pickled to send to the workers, but marshalled.
+    models = [
+        marshal.dumps(m) if isinstance(m, types.CodeType) else m
+        for m in models
+    ]
+    pool = multiprocessing.Pool(
+        jobs,
+        initializer=_init_worker,
+        initargs=(models, kwds)
+    )
+    finished = False
+    try:
+        for text, results in pool.imap(_replicate_worker, range(num)):
+            out.write(text)
+            yield results
+        finished = True
+    finally:
+        if finished:
+            pool.close()
+        else:
+            pool.terminate()
+        pool.join()
+
+
+def run(models, num, time, out=sys.stdout, fmt='csv', jobs=1, seed=None,
+        summary=None, warmup=0, batches=None, memory=None, watchdog=None,
+        profile=None, event_filter=None, diagnostics=sys.stderr, cache=None,
+        partition=None):
+    '''
+    Runs replications 0 to num-1 of a list of model files. Parameters:
+
+        - models: list of model file names, or of model code compiled by
+          compile_models
+        - num: number of replications to run
+        - time: clock time to run each replication for
+        - out (default=sys.stdout): output file handle, or None to write no
+          events, such as when only batch summaries are wanted
+        - fmt (default='csv'): 'csv', 'json', 'npy' or 'null'
+        - jobs (default=1): number of worker processes
+        - seed (default=None): master random seed
+        - summary (default=None): file handle to write a statistics summary
+          of each replication to
+        - warmup (default=0): time to simulate before events are output and
+          statistics are collected
+        - batches (default=None): number of batches to split each
+          replication into after the warm-up, which writes a summary of
+          each batch instead
+        - memory (default=None): file handle to write the memory use at the
+          end of each replication to
+        - watchdog (default=None): chute.watchdog.Watchdog that stops
+          replications early if their processes deadlock or starve
+        - profile (default=None): file handle to write a profile of the
+          simulator's work in each replication to
+        - event_filter (default=None): chute.sink.EventFilter that decides
+          which events are written to out
+        - diagnostics (default=sys.stderr): file handle to write the reason
+          a replication was stopped early to
+        - cache (default=None): dict of compiled models to reuse between
+          calls, as in compile_models
+        - partition (default=None): time to watch the models for to find
+          groups of processes that never share resources, which are then
+          simulated side by side in processes of their own. None does not
+          partition.
+    '''
+    stats = summary is not None
+    fields = BATCH_FIELDS if batches else SUMMARY_FIELDS
+    results = replications(
+        models,
+        num,
+        time,
+        out,
+        fmt,
+        jobs,
+        seed,
+        stats,
+        warmup,
+        batches,
+        memory is not None,
+        watchdog,
+        profile is not None,
+        event_filter,
+        cache,
+        partition
+    )
+    for n, (rows, usage, diagnostic, profile_rows) in enumerate(results):
+        if stats:
+            write_summary(summary, rows, fmt, n < 1, fields)
+        if memory is not None:
+            write_summary(memory, [usage], fmt, n < 1, MEMORY_FIELDS)
+        if profile is not None:
+            write_summary(profile, profile_rows, fmt, n < 1, PROFILE_FIELDS)
+        if diagnostic is not None:
+            write_diagnostic(diagnostics, diagnostic)
+
+
+def run_until(models, precision, max_num, time, out=sys.stdout, fmt='csv',
+              jobs=1, seed=None, summary=None, warmup=0, memory=None,
+              watchdog=None, profile=None, event_filter=None,
+              diagnostics=sys.stderr, partition=None):
+    '''
+    Runs replications of a list of model files, or of compiled model code,
+    until a chute.stats.Precision is done, or until max_num replications
+    have been run. The other parameters are the same as for run, except
+    that there are no batches. Returns the precision, which holds the
+    estimate and its confidence interval.
+
+    Replications are judged in order, so seeded runs stop after the same
+    number of replications for any number of jobs.
+    '''
+    results = replications(
+        models,
+        max_num,
+        time,
+        out,
+        fmt,
+        jobs,
+        seed,
+        True,
+        warmup,
+        None,
+        memory is not None,
+        watchdog,
+        profile is not None,
+        event_filter,
+        None,
+        partition
+    )
+    try:
+        for n, (rows, usage, diagnostic, profile_rows) in enumerate(results):
+            if summary is not None:
+                write_summary(summary, rows, fmt, header=n < 1)
+            if memory is not None:
+                write_summary(memory, [usage], fmt, n < 1, MEMORY_FIELDS)
+            if profile is not None:
+                write_summary(
+                    profile,
+                    profile_rows,
+                    fmt,
+                    n < 1,
+                    PROFILE_FIELDS
+                )
+            if diagnostic is not None:
+                write_diagnostic(diagnostics, diagnostic)
+            precision.add(rows)
+            if precision.done:
+                break
+    finally:
+        results.close()
+    return precision
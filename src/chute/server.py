@@ -0,0 +1,296 @@
+'''
+A simulation server. Running chute from scratch for a short simulation can
+take longer than the simulation itself, between starting Python, importing
+chute and compiling the models. A server does that once, and then runs
+simulations whenever a client asks, either over a Unix socket or over its
+own standard in and out.
+
+Clients send requests and read responses as JSON objects, one per line. A
+request looks like this:
+
+    {"models": ["/home/me/mm1_function.py"], "num": 10, "time": 100,
+     "seed": 42}
+
+models, num and time are required. fmt, jobs, seed and warmup are optional
+and mean the same as the options of the chute command, as does stats, which
+is true to get a statistics summary. Model file names are relative to the
+server's working directory. The server answers with any number of:
+
+    - {"output": TEXT}:  the next piece of the events output
+    - {"bytes": BASE64}: the same, in binary formats like npy
+    - {"stats": TEXT}:   the next piece of the statistics summary
+
+followed by either {"done": true} or {"error": MESSAGE}. Then the client can
+send another request, or close the connection.
+
+Compiled models are kept as long as their files do not change. Every client
+of a Unix socket is served by a child process forked from the server, so
+clients run side by side without seeing each other's state. Children tell
+the server which models they had to compile, and the server compiles them
+too, so clients that connect after that find them already compiled.
+'''
+from chute import dist
+from chute.runner import compile_models, run
+from chute.sink import BINARY_FORMATS, FORMATS
+import base64
+import json
+import os
+import socket
+import socketserver
+import sys
+import traceback
+
+
+class Server(object):
+    '''
+    Runs simulations for clients. models are files to compile up front, so
+    that every client gets them already compiled.
+    '''
+    def __init__(self, models=()):
+        self.cache = {}  # Model file -> (modification key, code).
+        self.compiled = None  # Called with the files a request compiled.
+        compile_models([os.path.abspath(m) for m in models], self.cache)
+
+    def serve(self, rfile, wfile):
+        '''Answers each request read from rfile on wfile until rfile ends.'''
+        try:
+            for line in rfile:
+                if line.strip():
+                    self.handle(line, wfile)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # The client went away.
+
+    def handle(self, line, wfile):
+        '''Runs the request on one line, writing its responses to wfile.'''
+        def send(message):
+            wfile.write(json.dumps(message) + '\n')
+            wfile.flush()
+
+        try:
+            self.run(json.loads(line), send)
+        except (BrokenPipeError, ConnectionResetError):
+            raise
+        except Exception as e:
+            error = traceback.format_exception_only(type(e), e)[-1].strip()
+            send({'error': error})
+        else:
+            send({'done': True})
+
+    def run(self, request, send):
+        '''Runs a request, passing each response but the last to send.'''
+        kwds = parse_request(request)
+        models = [os.path.abspath(m) for m in kwds.pop('models')]
+        cached = [self.cache.get(m) for m in models]
+        code = compile_models(models, self.cache)
+        compiled = [
+            m for m, c in zip(models, cached) if self.cache[m] is not c
+        ]
+        if compiled and self.compiled is not None:
+            self.compiled(compiled)
+
+        binary = kwds['fmt'] in BINARY_FORMATS
+        out = _Messages(send, 'bytes' if binary else 'output', binary)
+        summary = None
+        if kwds.pop('stats'):
+            summary = _Messages(send, 'stats', other=out)
+            out.other = summary
+
+        # A model from an earlier request may have vectorized chute.dist.
+        dist.vectorize(0)
+        run(code, out=out, summary=summary, **kwds)
+
+        out.flush()
+        if summary is not None:
+            summary.flush()
+
+
+def parse_request(request):
+    '''
+    Checks a request, and returns it as keyword arguments for
+    chute.runner.run plus stats. Raises ValueError if it is not valid.
+    '''
+    if not isinstance(request, dict):
+        raise ValueError('requests must be JSON objects')
+
+    models = request.get('models')
+    if isinstance(models, str):
+        models = [models]
+    if not models or not all(isinstance(m, str) for m in models):
+        raise ValueError('models must be a list of model files')
+
+    kwds = {
+        'models': models,
+        'num':    _field(request, 'num', int, lambda n: n > 0,
+                         'num must be > 0'),
+        'time':   _field(request, 'time', float, lambda t: t > 0,
+                         'time must be > 0'),
+        'fmt':    _field(request, 'fmt', str, lambda f: f in FORMATS,
+                         'fmt must be one of %s' % ', '.join(sorted(FORMATS)),
+                         'csv'),
+        'jobs':   _field(request, 'jobs', int, lambda j: j > 0,
+                         'jobs must be > 0', 1),
+        'seed':   None,
+        'stats':  bool(request.get('stats')),
+    }
+    kwds['warmup'] = _field(request, 'warmup', float,
+                            lambda w: 0 <= w < kwds['time'],
+                            'warmup must be >= 0 and < time', 0)
+    if request.get('seed') is not None:
+        kwds['seed'] = _field(request, 'seed', int, lambda s: True,
+                              'seed must be an integer')
+    return kwds
+
+
+def _field(request, name, convert, valid, message, default=None):
+    '''Converts and checks one field of a request.'''
+    value = request.get(name, default)
+    try:
+        value = convert(value)
+    except (TypeError, ValueError):
+        raise ValueError(message)
+    if not valid(value):
+        raise ValueError(message)
+    return value
+
+
+class _Messages(object):
+    '''
+    A file-like object that sends what is written to it as messages under
+    key, in pieces of about chunk_size. Writing to it first sends whatever
+    was written to other, so a client that writes both to the same place
+    gets them in the order they were written.
+    '''
+    def __init__(self, send, key, binary=False, chunk_size=1 << 16,
+                 other=None):
+        self.send = send
+        self.key = key
+        self.binary = binary
+        self.chunk_size = chunk_size
+        self.other = other
+        self._parts = []
+        self._size = 0
+
+    def write(self, data):
+        if not data:
+            return 0
+        if self.other is not None:
+            self.other.flush()
+        self._parts.append(data)
+        self._size += len(data)
+        if self._size >= self.chunk_size:
+            self.flush()
+        return len(data)
+
+    def flush(self):
+        if not self._parts:
+            return
+        if self.binary:
+            data = base64.b64encode(b''.join(self._parts)).decode('ascii')
+        else:
+            data = ''.join(self._parts)
+        self._parts = []
+        self._size = 0
+        self.send({self.key: data})
+
+
+class _ForkingUnixServer(socketserver.ForkingMixIn,
+                         socketserver.UnixStreamServer):
+    '''
+    Forks a child to serve each client. Children write the names of the
+    model files they compile to a pipe, one per line, and between clients
+    the server compiles them into its own cache, which children forked
+    later inherit.
+    '''
+    def __init__(self, path, handler, server):
+        super().__init__(path, handler)
+        self.cache = server.cache
+        self.pending = b''
+        self.reader, writer = os.pipe()
+        os.set_blocking(self.reader, False)
+        os.set_blocking(writer, False)
+        server.compiled = lambda models: _send(writer, models)
+
+    def service_actions(self):
+        super().service_actions()
+        try:
+            data = os.read(self.reader, 1 << 16)
+        except BlockingIOError:
+            return
+        lines = (self.pending + data).split(b'\n')
+        self.pending = lines.pop()
+        for model in set(lines):
+            try:
+                compile_models([model.decode()], self.cache)
+            except (OSError, SyntaxError, ValueError):
+                pass  # The client that asked for it has been told.
+
+    def server_close(self):
+        super().server_close()
+        os.close(self.reader)
+
+
+def _send(fd, models):
+    '''Writes model file names to a pipe, unless it is full.'''
+    try:
+        os.write(fd, ''.join(m + '\n' for m in models).encode())
+    except BlockingIOError:
+        pass  # The server compiles them the next time they are asked for.
+
+
+def _remove_stale(path):
+    '''Removes a socket at path that nothing is listening on anymore.'''
+    if not os.path.exists(path):
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except ConnectionRefusedError:
+        os.unlink(path)
+    except OSError:
+        pass  # Not a socket. Binding to it fails with a clear error.
+    else:
+        raise ValueError('a server is already listening on %s' % path)
+    finally:
+        probe.close()
+
+
+def serve_socket(path, models=()):
+    '''
+    Serves clients on a Unix socket at path until interrupted. models are
+    files to compile up front.
+    '''
+    server = Server(models)
+
+    class Handler(socketserver.BaseRequestHandler):
+        def handle(self):
+            rfile = self.request.makefile('r', encoding='utf-8')
+            wfile = self.request.makefile('w', encoding='utf-8')
+            try:
+                server.serve(rfile, wfile)
+            finally:
+                rfile.close()
+                try:
+                    wfile.close()
+                except OSError:
+                    pass
+
+    _remove_stale(path)
+    listener = _ForkingUnixServer(path, Handler, server)
+    try:
+        listener.serve_forever()
+    finally:
+        listener.server_close()
+        os.unlink(path)
+
+
+def serve_stdio(models=()):
+    '''
+    Serves requests from standard in, with responses on standard out, until
+    standard in ends. models are files to compile up front.
+    '''
+    # Anything the models print would garble the responses.
+    responses, sys.stdout = sys.stdout, sys.stderr
+    try:
+        Server(models).serve(sys.stdin, responses)
+    finally:
+        sys.stdout = responses
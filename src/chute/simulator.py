@@ -1,18 +1,43 @@
+from chute import dist
 from chute.event import Event
 from chute.event_gen import CreateEventGenerator
-from csv import DictWriter
+from chute.event_list import EVENT_LISTS
+from chute.resource import Pool, Unit
+from chute.sink import FIELDS, FilterSink, NullSink, create as create_sink
+from chute.trace import Trace
+from contextlib import contextmanager
 from functools import wraps
 import heapq
-import json
-import os
+import random
 import sys
+import threading
+import tracemalloc
 
+# Processes registered by @process, as process -> interarrival function. The
+# registry used can be switched per thread while loading a model, so models
+# loaded in different places never see each other's processes.
 PROCESSES = {}
+_local = threading.local()
+
+MEMORY_FIELDS = (
+    'simulation',         # Simulation number.
+    'clock',              # Simulation time.
+    'processes',          # Processes started, but not finished.
+    'queued',             # Event generators in the event queue.
+    'parked',             # Event generators parked on wait lists.
+    'wait_entries',       # Entries on wait lists, live or not.
+    'assigned',           # Entries in the assignment table.
+    'assignees',          # Processes with resources assigned to them.
+    'holding',            # Processes in the middle of a hold.
+    'traced_bytes',       # Memory allocated, if tracemalloc is tracing.
+    'peak_bytes',         # Most memory allocated, if tracemalloc is tracing.
+    'bytes_per_process'   # traced_bytes for each process in the system.
+)
 
 
 # TODO: This needs to use the decorator util library, but I can't remember
 #       exactly how that works without the documentation at hand...
-def process(interarrival):
+def process(interarrival, resources=None):
     '''
     Registers a process with the simulator. A process can be anything that is
     callable and is a generator, including classes that implement __call__.
@@ -23,15 +48,24 @@ def process(interarrival):
     multiple times within the same thread without damaging its state.
 
     interarrival can be either a number representing the interarrival time
-    between creating new instances of the process or a function that returns
-    the next interarrival time.
+    between creating new instances of the process, a function that returns
+    the next interarrival time, or a chute.Trace of arrival times to replay.
+
+    resources can list everything the process ever requests, if that is
+    known up front, so chute.partition can tell which processes share
+    resources without watching them first.
     '''
     def decorator(p):
+        if resources is not None:
+            p._chute_resources = tuple(resources)
+
         # If interarrival is not callable, turn it into a function that is.
-        if callable(interarrival):
-            PROCESSES[p] = interarrival
+        # Traces make a new function for each simulation.
+        processes = getattr(_local, 'processes', PROCESSES)
+        if callable(interarrival) or isinstance(interarrival, Trace):
+            processes[p] = interarrival
         else:
-            PROCESSES[p] = lambda: interarrival
+            processes[p] = lambda: interarrival
 
         @wraps
         def wrapper(*args, **kwds):
@@ -41,43 +75,160 @@ def process(interarrival):
     return decorator
 
 
+@contextmanager
+def registering(processes):
+    '''
+    Registers processes in the dict processes instead of PROCESSES, while in
+    this context and in this thread. For example, this collects the processes
+    of a model file without touching anything registered so far:
+
+        processes = {}
+        with registering(processes):
+            exec(code, {'__name__': '__chute__'})
+        simulator = Simulator(registry=processes)
+    '''
+    previous = getattr(_local, 'processes', None)
+    _local.processes = processes
+    try:
+        yield processes
+    finally:
+        if previous is None:
+            del _local.processes
+        else:
+            _local.processes = previous
+
+
 class Simulator(object):
-    MESSAGE_FIELDS = [
-        'simulation',        # Simulation number.
-        'sent_time',         # Time an event is sent to the simulator.
-        'start_time',        # Time an event starts processing.
-        'stop_time',         # Time that event stops processing..
-        'event_type',        # Event type (create, request, etc.).
-        'process_name',      # Process name (e.g. 'customer')
-        'process_instance',  # Process instance number (e.g. 5)
-        'assigned'           # Resources assigned after the event is fulfilled
-                             # (e.g., ['server 1', etc.])
-    ]
-
-    def __init__(self, num=1, out=sys.stdout, fmt='csv'):
+    MESSAGE_FIELDS = list(FIELDS)
+
+    def __init__(self, num=1, out=sys.stdout, fmt='csv', wait_lists=True,
+                 seed=None, sink=None, stats=None, event_list='heap',
+                 watchdog=None, profile=None, registry=None,
+                 event_filter=None):
         '''
         Instantiates a simulator. Parameters:
 
             - num (default=1): simulation number
             - out (default=sys.stdout): output file handle
-            - fmt (default='csv'): 'csv' or 'json'
+            - fmt (default='csv'): 'csv', 'json', 'npy' or 'null'
+            - wait_lists (default=True): park blocked processes on wait lists
+              keyed by the resources they need, instead of retrying them
+              after every event
+            - seed (default=None): master random seed. If given, each process
+              draws its interarrival and hold times from its own streams,
+              derived from the seed, simulation number and process name.
+            - sink (default=None): Sink that receives processed events. If
+              None, one is created that writes fmt to out.
+            - stats (default=None): chute.stats.Statistics instance to
+              collect streaming statistics in while running
+            - event_list (default='heap'): 'heap' or 'calendar', the kind of
+              future event list to use. A calendar queue takes constant time
+              per event, which can pay off with huge numbers of processes.
+            - watchdog (default=None): chute.watchdog.Watchdog instance that
+              stops the simulation early if processes deadlock or starve.
+              The reason is left in the simulator's diagnostic attribute.
+            - profile (default=None): chute.profile.Profile instance to count
+              and time the simulator's work in while running
+            - registry (default=None): dict of the processes to simulate,
+              as process -> interarrival function, such as the processes
+              returned by chute.runner.load_models. If None, a copy of the
+              processes registered in PROCESSES is taken when the simulation
+              starts, so processes registered after the simulator is made
+              are included.
+            - event_filter (default=None): chute.sink.EventFilter that
+              decides which events are passed on to the sink. Statistics
+              are still collected from every event.
         '''
         self.num = num
         self.out = out
         self.fmt = fmt
+        self.wait_lists = wait_lists
+        self.seed = seed
+
+        if sink is None:
+            sink = create_sink(fmt, out)
+        if event_filter is not None:
+            sink = FilterSink(sink, event_filter)
+        self.sink = sink
+        self.stats = stats
+
+        if event_list not in EVENT_LISTS:
+            raise ValueError('unknown event list: %r' % event_list)
+        self.event_list = event_list
+        self.watchdog = watchdog
+        self.profile = profile
+
+        self.registry = registry
 
-        # TODO: Abstract the message handling component so we can allow
-        #       for any format. Provide a Message class and a message hook
-        #       so we can also measure things like queue length.
-        if fmt == 'csv':
-            self.writer = DictWriter(self.out, self.MESSAGE_FIELDS)
-            if self.num < 1:
-                self.writer.writeheader()
+        self.reset()
 
+    def reset(self):
+        '''
+        Puts the simulator back at time 0. Its next run starts over with
+        fresh processes instead of picking up where the last one stopped.
+        '''
         self.clock = 0
         self.assigned = {}
-        self.assignees = {}
+        self.assignees = {}  # Requester -> dict of resources, in order.
         self.holding = set()
+        self.streams = {}
+
+        # Free units of each Pool in use, as [next unused index, free heap].
+        # Units only get an index once they are first handed out, and the
+        # lowest free index is handed out first, as with a list of options.
+        self.pools = {}
+
+        # Blocked event generators, indexed both ways so that waking them
+        # up only touches the resources that actually changed.
+        self.waiting = {}     # Resource -> heap of waiting generators.
+        self.waits = {}       # Event generator -> (token, entries) parked.
+        self.woken = []       # Event generators ready to be retried.
+        self.woken_for = {}   # Woken event generator -> resource freed.
+        self.tokens = 0
+
+        # Entries on all wait lists, and how many of them are still live.
+        # The rest are left over from generators that have been woken.
+        self.entries = 0
+        self.live_entries = 0
+
+        self.processes = 0  # Processes that have started, but not finished.
+
+        # Future event list of event generators, keyed by the time, priority
+        # and sequence number of their next events, or None if the simulation
+        # has not started yet.
+        self.events = None
+        self.sequence = 0
+
+        # Why the simulation was stopped early, if it was, and the number of
+        # events until the watchdog checks on it again.
+        self.diagnostic = None
+        self.countdown = 0
+
+    def snapshot(self):
+        '''
+        Freezes a copy of the simulator as it is right now, and returns it as
+        a chute.snapshot.Snapshot. Each restore of the snapshot runs from the
+        same state, so a warm-up only needs to be simulated once. Raises
+        OSError where os.fork is not available.
+        '''
+        from chute.snapshot import Snapshot
+        return Snapshot(self)
+
+    def stream(self, *keys):
+        '''
+        Returns the random stream for a set of keys in this simulation, or
+        None if the simulator is not seeded. Streams with the same keys are
+        the same across simulators with the same seed and number, so model
+        variants can be compared using common random numbers.
+        '''
+        if self.seed is None:
+            return None
+
+        try:
+            return self.streams[keys]
+        except KeyError:
+            rng = self.streams[keys] = dist.stream(self.seed, self.num, *keys)
+            return rng
 
     def _get_resource(self, resource):
         '''
@@ -116,15 +267,58 @@ class Simulator(object):
         except KeyError:  # Unassigned. Assign to requester.
             self.assigned[resource] = requester
             try:
-                self.assignees[requester].add(resource)
+                self.assignees[requester][resource] = None
             except KeyError:
-                self.assignees[requester] = set([resource])
+                self.assignees[requester] = {resource: None}
+            if self.stats is not None:
+                self.stats.assigned(self, resource)
             return True
 
+    def assign_unit(self, requester, pool):
+        '''
+        Assigns any free unit of a Pool to requester. Returns the Unit, or
+        None if the pool has nothing free.
+        '''
+        requester = self._get_resource(requester)
+        if requester in self.assigned:
+            return None
+
+        try:
+            state = self.pools[pool]
+        except KeyError:
+            state = self.pools[pool] = [0, []]
+
+        if state[1]:
+            index = heapq.heappop(state[1])
+        elif state[0] < pool.capacity:
+            index = state[0]
+            state[0] += 1
+        else:
+            return None
+
+        unit = Unit(pool, index)
+        try:
+            self.assignees[requester][unit] = None
+        except KeyError:
+            self.assignees[requester] = {unit: None}
+        if self.stats is not None:
+            self.stats.assigned(self, unit)
+        return unit
+
+    def available(self, pool):
+        '''Returns the number of free units in a Pool.'''
+        try:
+            next_index, free = self.pools[pool]
+        except KeyError:
+            return pool.capacity
+        return pool.capacity - next_index + len(free)
+
     def assigned_to(self, requester, resource):
         '''True if the requested object is assigned to requester.'''
         requester = self._get_resource(requester)
         resource = self._get_resource(resource)
+        if isinstance(resource, Unit):
+            return resource in self.resources(requester)
         try:
             return self.assigned[resource] is requester
         except KeyError:
@@ -143,34 +337,225 @@ class Simulator(object):
         '''Removes a requester from the holding list.'''
         requester = self._get_resource(requester)
         self.holding.discard(requester)
+        self._wake(requester)
 
     def resources(self, requester):
-        '''Returns the resources assigned to a requester.'''
+        '''
+        Returns the resources assigned to a requester, as a dict whose keys
+        are in the order they were assigned.
+        '''
         try:
             return self.assignees[self._get_resource(requester)]
         except KeyError:
-            return set()
+            return {}
 
     def release(self, requester, resource):
         '''Releases the requested object from requester.'''
         requester = self._get_resource(requester)
         resource = self._get_resource(resource)
 
+        # Units are not in the assigned table. Their pool gets them back.
+        if isinstance(resource, Unit):
+            try:
+                resources = self.assignees[requester]
+                del resources[resource]
+            except KeyError:
+                return False
+            if not resources:
+                del self.assignees[requester]
+            heapq.heappush(self.pools[resource.pool][1], resource.index)
+            if self.stats is not None:
+                self.stats.released(self, resource)
+            self._wake(resource.pool)
+            return True
+
         try:
             assert self.assigned[resource] is requester
             del self.assigned[resource]
-            self.assignees[requester].discard(resource)
+            resources = self.assignees[requester]
+            resources.pop(resource, None)
+            if not resources:
+                del self.assignees[requester]
         except:
             return False
 
+        if self.stats is not None:
+            self.stats.released(self, resource)
+        self._wake(resource)
         return True
 
-    def run(self, time):
+    def _available(self, resource):
+        '''True if a resource could be assigned to someone right now.'''
+        if isinstance(resource, Pool):
+            return self.available(resource) > 0
+        return resource not in self.assigned and resource not in self.holding
+
+    def _wait(self, event_gen, event):
+        '''
+        Parks a blocked event generator on the wait lists of the resources
+        its next event is waiting on. Returns True if it was parked, or False
+        if it has to stay in the event queue and be retried.
+        '''
+        if not self.wait_lists:
+            return False
+
+        resources = event.waits_on(self)
+        if not resources:
+            return False
+
+        # Wait lists are heaps ordered the same way the event queue is, so
+        # the earliest blocked event gets the first shot at a resource. A
+        # generator parks on several lists at once, so each parking gets a
+        # token and entries with an old token are skipped when popped.
+        self.tokens += 1
+        self.waits[event_gen] = (self.tokens, len(resources))
+        entry = (event.clock, self.tokens, event_gen)
+        for resource in resources:
+            try:
+                heapq.heappush(self.waiting[resource], entry)
+            except KeyError:
+                self.waiting[resource] = [entry]
+
+        self.entries += len(resources)
+        self.live_entries += len(resources)
+        return True
+
+    def _wake(self, resource):
+        '''
+        Moves the first event generator waiting on a resource to the woken
+        list. Only one is woken at a time. If it does not take the resource,
+        the run loop hands it on to the next one in line.
+        '''
+        waiters = self.waiting.get(resource)
+        while waiters:
+            _, token, event_gen = heapq.heappop(waiters)
+            self.entries -= 1
+            try:
+                parked, count = self.waits[event_gen]
+            except KeyError:
+                continue
+            if parked == token:
+                del self.waits[event_gen]
+                self.live_entries -= count
+                self.woken.append(event_gen)
+                self.woken_for[event_gen] = resource
+                break
+
+        if not waiters:
+            self.waiting.pop(resource, None)
+
+        # Entries left behind on other lists pin their generators, so once
+        # they outnumber the live ones, sweep them all out.
+        if self.entries - self.live_entries > self.live_entries + 1024:
+            self._sweep()
+
+    def _sweep(self):
+        '''Drops every wait list entry that no longer counts.'''
+        for resource, waiters in list(self.waiting.items()):
+            waiters = [
+                entry for entry in waiters
+                if self.waits.get(entry[2], (None,))[0] == entry[1]
+            ]
+            if waiters:
+                heapq.heapify(waiters)
+                self.waiting[resource] = waiters
+            else:
+                del self.waiting[resource]
+        self.entries = self.live_entries
+
+    def _reclaim(self, event_gen):
+        '''
+        Forgets a process that has finished. Whatever it was assigned and did
+        not release stays assigned, but nothing else refers to it anymore.
+        Creators finish too once a trace runs out, but they are not counted
+        as processes.
+        '''
+        if not isinstance(event_gen, CreateEventGenerator):
+            self.processes -= 1
+        self.holding.discard(event_gen)
+        self.woken_for.pop(event_gen, None)
+
+    def _tick(self):
+        '''Counts down to the watchdog's next check.'''
+        if self.watchdog is not None:
+            self.countdown -= 1
+            if self.countdown <= 0:
+                self._watch()
+
+    def _watch(self):
+        '''Lets the watchdog check whether the simulation should stop.'''
+        if self.diagnostic is None:
+            self.diagnostic = self.watchdog.check(self)
+        self.countdown = self.watchdog.delay(self)
+
+    def memory(self):
+        '''
+        Returns a dict describing the memory the simulation is using, keyed
+        by MEMORY_FIELDS. Bytes are only measured if tracemalloc is tracing,
+        and are None otherwise.
+        '''
+        traced_bytes = peak_bytes = bytes_per_process = None
+        if tracemalloc.is_tracing():
+            traced_bytes, peak_bytes = tracemalloc.get_traced_memory()
+            bytes_per_process = traced_bytes // max(self.processes, 1)
+
+        return {
+            'simulation':        self.num,
+            'clock':             self.clock,
+            'processes':         self.processes,
+            'queued':            len(self.events or ()),
+            'parked':            len(self.waits),
+            'wait_entries':      self.entries,
+            'assigned':          len(self.assigned),
+            'assignees':         len(self.assignees),
+            'holding':           len(self.holding),
+            'traced_bytes':      traced_bytes,
+            'peak_bytes':        peak_bytes,
+            'bytes_per_process': bytes_per_process,
+        }
+
+    def start(self):
+        '''
+        Sets up a new simulation at time 0 without processing any events,
+        unless it has already started. run does this by itself, so calling
+        start first only separates the cost of setting up from running.
+        '''
+        if self.events is None:
+            self._start()
+
+    def _start(self):
+        '''Starts a new simulation at time 0, with one creator per process.'''
+        # Processes draw from their own streams if we have a seed. Models
+        # that use the random module directly get a seeded one as well.
+        dist.reset()
+        if self.seed is not None:
+            random.seed(dist.stream(self.seed, self.num).random())
+
+        self.sink.open(self)
+
+        self.events = EVENT_LISTS[self.event_list]()
+        if self.profile is not None:
+            self.events = self.profile.timed_events(self.events)
+        if self.registry is None:
+            self.registry = dict(PROCESSES)
+        for process, interarrival in self.registry.items():
+            self._schedule(CreateEventGenerator(self, process, interarrival))
+
+    def _schedule(self, event_gen):
+        '''Puts an event generator in the future event list.'''
+        event = event_gen.peek
+        self.sequence += 1
+        self.events.push(
+            (event.clock, event.PRIORITY, self.sequence, event_gen)
+        )
+
+    def run(self, time, warmup=0):
         '''
         Run the simulation until a particular time or until no more events
-        are generated, whichever comes first. As events are processed, messages
-        are generated in the format specified upon instantiation. Messages
-        contain the following fields:
+        are generated, whichever comes first. As events are processed, they
+        are passed to the simulator's sink. The default sinks write messages
+        in the format specified upon instantiation. Messages contain the
+        following fields:
 
             - simulation:        simuluation number.
             - sent time:         time an event is sent to the simulator.
@@ -181,23 +566,46 @@ class Simulator(object):
             - process instance:  process instance number (e.g. 5)
             - assigned:          resources assigned after the event is
                                  fulfilled (e.g., ['server 1', etc.])
+
+        Running again picks up where the last run stopped, so run(1000)
+        followed by run(2000) gives the same events as run(2000) alone. Call
+        reset first to start over.
+
+        Events before the warmup time are simulated, but they are not passed
+        to the sink, and statistics are reset once the warm-up is over. This
+        removes the bias of starting from an empty system.
         '''
-        self.clock = 0
-        self.assigned = {}
+        sink = self.sink
+        if self.profile is not None:
+            self.profile.start(self)
+            sink = self.profile.timed_sink(sink)
+
+        if self.events is None:
+            self._start()
 
-        # A heap of event generators, prioritized by their next event times.
-        heap = []
-        for process, interarrival in PROCESSES.items():
-            event_gen = CreateEventGenerator(self, process, interarrival)
-            heapq.heappush(heap, event_gen)
+        if self.clock < warmup:
+            self._advance(min(warmup, time), NullSink())
+            if self.stats is not None and self.clock >= warmup:
+                self.stats.reset(self)
 
-        while heap:
+        self._advance(time, sink)
+        sink.close(self)
+
+        if self.profile is not None:
+            self.profile.stop(self)
+
+    def _advance(self, time, sink):
+        '''Processes events up to a point in time, passing them to sink.'''
+        events = self.events
+        schedule = self._schedule
+
+        while events and self.diagnostic is None:
             generators = []  # Stack of event generators.
 
             while True:
-                # Get the next event generator off the heap.
+                # Get the next event generator off the event list.
                 try:
-                    event_gen = heapq.heappop(heap)
+                    event_gen = events.pop()[3]
                 except IndexError:
                     break  # Nothing to do. Quit the simulation.
 
@@ -212,56 +620,74 @@ class Simulator(object):
                 if self.clock > time:
                     break
 
-                # See if it has an event we can process.
-                if event.start(self):
-                    # See if it can be processed in its entirety.
-                    if not event.stop(self):
-                        continue
+                # See if it has an event we can process in its entirety.
+                processed = event.start(self) and event.stop(self)
 
-                    # Take this event off the queue.
-                    event_gen.next
+                # If this generator was woken up for a resource it did not
+                # end up taking, wake the next one waiting on it instead.
+                freed = self.woken_for.pop(event_gen, None)
+                if freed is not None and self._available(freed):
+                    self._wake(freed)
 
-                    # Format the assigned list for CSV. For other formats
-                    # just use the list of strings we have.
-                    alist = self.resources(event)
-                    if self.fmt == 'csv':
-                        aout = ', '.join(str(x) for x in alist)
+                if not processed:
+                    if self.clock < event.clock:
+                        # Waiting for time to pass, such as a hold that
+                        # just started. Put it back where it belongs.
+                        schedule(generators.pop())
                     else:
-                        aout = [str(a) for a in alist]
-
-                    # Generate a DES message.
-                    message = {
-                        'simulation':       self.num,
-                        'sent_time':        event.sent_time,
-                        'start_time':       event.start_time,
-                        'stop_time':        event.stop_time,
-                        'event_type':       event.event_type,
-                        'process_name':     event.process_name,
-                        'process_instance': event.process_instance,
-                        'assigned':         aout
-                    }
-
-                    if self.fmt == 'csv':
-                        self.writer.writerow(message)
-                    elif self.fmt == 'json':
-                        self.out.write(json.dumps(message) + os.linesep)
-
-                    # If the generator is done, take it off our list.
-                    if event_gen.done:
-                        generators.pop()
-
-                    # See if this event spawns a new event generator.
-                    next_gen = event.spawn()
-                    if next_gen is not None:
-                        generators.append(next_gen)
+                        if self.stats is not None:
+                            self.stats.blocked(self, event)
+                        if self.profile is not None:
+                            self.profile.blocked(self, event)
+                        if self._wait(event_gen, event):
+                            generators.pop()
+                            self._tick()
+
+                    generators.extend(self.woken)
+                    del self.woken[:]
+                    continue
+
+                # Take this event off the queue.
+                event_gen.next
+
+                # Let the sink build whatever it needs from the event.
+                sink.emit(self, event)
+                if self.stats is not None:
+                    self.stats.processed(self, event)
+                if self.profile is not None:
+                    self.profile.processed(self, event)
+
+                # If the generator is done, take it off our list.
+                if event_gen.done:
+                    generators.pop()
+                    self._reclaim(event_gen)
+
+                # See if this event spawns a new event generator.
+                next_gen = event.spawn()
+                if next_gen is not None:
+                    generators.append(next_gen)
+                    self.processes += 1
+
+                # Anything this event unblocked goes back in the queue.
+                generators.extend(self.woken)
+                del self.woken[:]
+
+                self._tick()
+                break
 
-                    break
+            # Add back all the generators we removed in order to find
+            # an event that could be processed. They stay there for the next
+            # run if this event is past our time.
+            while generators:
+                schedule(generators.pop())
 
             # If this event is past our time, stop.
             if self.clock > time:
                 break
 
-            # Add back all the generators we removed in order to find
-            # an event that could be processed.
-            while generators:
-                heapq.heappush(heap, generators.pop())
+        # The clock may have run past the end looking for the next event.
+        self.clock = min(self.clock, time)
+
+        # If everything left is blocked, there is nothing more to wait for.
+        if not events and self.watchdog is not None:
+            self._watch()
@@ -0,0 +1,232 @@
+import csv
+import json
+import os
+import zlib
+
+FIELDS = (
+    'simulation',        # Simulation number.
+    'sent_time',         # Time an event is sent to the simulator.
+    'start_time',        # Time an event starts processing.
+    'stop_time',         # Time that event stops processing..
+    'event_type',        # Event type (create, request, etc.).
+    'process_name',      # Process name (e.g. 'customer')
+    'process_instance',  # Process instance number (e.g. 5)
+    'assigned'           # Resources assigned after the event is fulfilled
+                         # (e.g., ['server 1', etc.])
+)
+
+
+def record(simulator, event):
+    '''
+    Returns a compact tuple of an event's fields, in the order of FIELDS.
+    Assigned resources are given as a tuple of the resources themselves.
+    '''
+    return (
+        simulator.num,
+        event.sent_time,
+        event.start_time,
+        event.stop_time,
+        event.event_type,
+        event.process_name,
+        event.process_instance,
+        tuple(simulator.resources(event))
+    )
+
+
+class Sink(object):
+    '''
+    Receives events from the simulator as they are processed. Sinks get the
+    event itself, so they only pay for building the records they use. To
+    write a new kind of sink, override any of these methods.
+    '''
+    def open(self, simulator):
+        '''Called when a simulator starts running.'''
+        pass
+
+    def emit(self, simulator, event):
+        '''Called with each event once it has been processed.'''
+        pass
+
+    def close(self, simulator):
+        '''Called when a simulator stops running.'''
+        pass
+
+
+class NullSink(Sink):
+    '''Throws every event away, for runs that only need to be timed.'''
+    pass
+
+
+class CSVSink(Sink):
+    '''
+    Writes one CSV row per event. The header is written by simulation 0, so
+    simulations run one after another produce a single CSV file.
+    '''
+    def __init__(self, out):
+        self.out = out
+        self.writer = csv.writer(out)
+
+    def open(self, simulator):
+        if simulator.num < 1:
+            self.writer.writerow(FIELDS)
+
+    def emit(self, simulator, event):
+        self.writer.writerow((
+            simulator.num,
+            event.sent_time,
+            event.start_time,
+            event.stop_time,
+            event.event_type,
+            event.process_name,
+            event.process_instance,
+            ', '.join(str(x) for x in simulator.resources(event))
+        ))
+
+
+class JSONSink(Sink):
+    '''Writes one JSON dictionary per event, one per line.'''
+    def __init__(self, out):
+        self.out = out
+
+    def emit(self, simulator, event):
+        message = {
+            'simulation':       simulator.num,
+            'sent_time':        event.sent_time,
+            'start_time':       event.start_time,
+            'stop_time':        event.stop_time,
+            'event_type':       event.event_type,
+            'process_name':     event.process_name,
+            'process_instance': event.process_instance,
+            'assigned':         [str(a) for a in simulator.resources(event)]
+        }
+        self.out.write(json.dumps(message) + os.linesep)
+
+
+class CallbackSink(Sink):
+    '''Calls a function with the record tuple of each event.'''
+    def __init__(self, callback):
+        self.callback = callback
+
+    def emit(self, simulator, event):
+        self.callback(record(simulator, event))
+
+
+class ListSink(Sink):
+    '''Keeps the record tuple of each event in a list, in memory.'''
+    def __init__(self):
+        self.records = []
+
+    def emit(self, simulator, event):
+        self.records.append(record(simulator, event))
+
+    def dicts(self):
+        '''Iterates over the records as dictionaries keyed by FIELDS.'''
+        for r in self.records:
+            yield dict(zip(FIELDS, r))
+
+
+class EventFilter(object):
+    '''
+    Decides which events are passed on to a sink. Parameters:
+
+        - event_types (default=None): event types to keep, or None for all
+        - process_names (default=None): process names to keep, or None for
+          all
+        - start (default=None): earliest time to keep events from
+        - stop (default=None): latest time to keep events until
+        - sample (default=None): fraction of process instances to keep all
+          the events of, or None for all of them
+
+    Times are those at which events are processed. Which instances are
+    sampled depends only on their process names and instance numbers, so
+    the random numbers of the simulation are not touched, and the same
+    instances are sampled in every simulation.
+    '''
+    def __init__(self, event_types=None, process_names=None, start=None,
+                 stop=None, sample=None):
+        self.event_types = None if event_types is None else set(event_types)
+        self.process_names = (
+            None if process_names is None else set(process_names)
+        )
+        self.start = start
+        self.stop = stop
+        self.sample = sample
+        self.threshold = None if sample is None else int(sample * (1 << 32))
+        self.hashes = {}  # Process name -> hash to mix into samples.
+
+    def __call__(self, simulator, event):
+        '''True if an event should be passed on.'''
+        event_types = self.event_types
+        if event_types is not None and event.event_type not in event_types:
+            return False
+        names = self.process_names
+        if names is not None and event.process_name not in names:
+            return False
+        if self.start is not None and simulator.clock < self.start:
+            return False
+        if self.stop is not None and simulator.clock > self.stop:
+            return False
+        if self.threshold is not None:
+            return self._sampled(event.process_name, event.process_instance)
+        return True
+
+    def _sampled(self, name, instance):
+        try:
+            h = self.hashes[name]
+        except KeyError:
+            h = self.hashes[name] = zlib.crc32(name.encode('utf-8'))
+
+        # Fibonacci hashing spreads consecutive instances evenly.
+        h = ((instance + h) * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+        return (h >> 32) < self.threshold
+
+
+class FilterSink(Sink):
+    '''
+    Passes only the events an EventFilter keeps on to another sink. Events
+    that are left out never reach the other sink, so nothing is built for
+    them.
+    '''
+    def __init__(self, sink, event_filter):
+        self.sink = sink
+        self.event_filter = event_filter
+
+    def open(self, simulator):
+        self.sink.open(simulator)
+
+    def emit(self, simulator, event):
+        if self.event_filter(simulator, event):
+            self.sink.emit(simulator, event)
+
+    def close(self, simulator):
+        self.sink.close(simulator)
+
+    def flush(self):
+        flush = getattr(self.sink, 'flush', None)
+        if flush is not None:
+            flush()
+
+
+def _columnar(out):
+    from chute.columnar import ColumnarSink
+    return ColumnarSink(out)
+
+
+# Sinks that write to a file handle, by output format name.
+FORMATS = {
+    'csv':  CSVSink,
+    'json': JSONSink,
+    'npy':  _columnar,
+    'null': lambda out: NullSink(),
+}
+
+# Formats that write bytes rather than text.
+BINARY_FORMATS = ('npy',)
+
+
+def create(fmt, out):
+    '''Returns a sink that writes events to out in a named format.'''
+    try:
+        return FORMATS[fmt](out)
+    except KeyError:
+        raise ValueError('unknown output format: %r' % fmt)
@@ -0,0 +1,137 @@
+'''
+Snapshots of a simulator's state, so a warm-up period can be simulated once
+and used as the starting point of many runs or what-if branches.
+
+Processes are live Python generators, which cannot be copied or pickled. A
+snapshot instead keeps a frozen copy of the whole simulator in a child
+process, made with os.fork, so it is only available on Unix. Each restore
+forks a fresh copy of the frozen one, calls a function with it, and sends
+back what the function returns:
+
+    def branch(simulator, time):
+        simulator.run(time)
+        return simulator.stats.summary(simulator)
+
+    simulator = chute.Simulator(fmt='null', stats=Statistics())
+    simulator.run(1000)
+    snapshot = simulator.snapshot()
+    results = [snapshot.restore(branch, t) for t in (2000, 5000)]
+    snapshot.close()
+
+Functions and their arguments and results are pickled, so functions should
+be defined at module level before the snapshot is taken. Restored copies
+share the simulator's output file, so branches usually collect statistics
+and use the null format.
+'''
+import multiprocessing
+import os
+import sys
+
+
+class Snapshot(object):
+    '''A frozen copy of a simulator, kept in a child process.'''
+    def __init__(self, simulator):
+        if not hasattr(os, 'fork'):
+            raise OSError('snapshots need os.fork, which is only on Unix')
+
+        self.clock = simulator.clock
+        self.conn, child = multiprocessing.Pipe()
+
+        # Anything still buffered would be written by both processes.
+        flush = getattr(simulator.sink, 'flush', None)
+        if flush is not None:
+            flush()
+        simulator.out.flush()
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+        self.pid = os.fork()
+        if not self.pid:
+            self.conn.close()
+            _serve(simulator, child)
+        child.close()
+
+    def restore(self, func, *args):
+        '''
+        Calls func(simulator, *args) with a copy of the simulator as it was
+        when the snapshot was taken, in a process of its own, and returns
+        whatever it returns. Exceptions it raises are raised here.
+        '''
+        if self.pid is None:
+            raise ValueError('snapshot is closed')
+
+        self.conn.send((func, args))
+        ok, result = self.conn.recv()
+        if not ok:
+            raise result
+        return result
+
+    def close(self):
+        '''Stops the child process holding the snapshot.'''
+        if self.pid is None:
+            return
+        self.conn.send(None)
+        self.conn.close()
+        os.waitpid(self.pid, 0)
+        self.pid = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _serve(simulator, conn):
+    '''Restores copies of the simulator on request. Never returns.'''
+    status = 0
+    try:
+        while True:
+            try:
+                request = conn.recv()
+            except EOFError:
+                break  # The parent went away.
+            except Exception as e:
+                conn.send((False, e))  # Could not unpickle the function.
+                continue
+
+            if request is None:
+                break
+
+            func, args = request
+            reader, writer = multiprocessing.Pipe(False)
+            pid = os.fork()
+            if not pid:
+                reader.close()
+                _branch(simulator, func, args, writer)
+
+            writer.close()
+            try:
+                result = reader.recv()
+            except EOFError:
+                result = (False, RuntimeError('restored simulator crashed'))
+            reader.close()
+            os.waitpid(pid, 0)
+            conn.send(result)
+
+    except BaseException:
+        status = 1
+    finally:
+        os._exit(status)
+
+
+def _branch(simulator, func, args, conn):
+    '''Runs func on a restored copy of the simulator. Never returns.'''
+    status = 0
+    try:
+        try:
+            result = (True, func(simulator, *args))
+        except Exception as e:
+            result = (False, e)
+        simulator.out.flush()
+        sys.stdout.flush()
+        conn.send(result)
+    except BaseException:
+        status = 1
+    finally:
+        os._exit(status)
@@ -0,0 +1,262 @@
+'''
+Parameter sweeps. A sweep runs replications of a list of model files at
+every point of a grid of parameter values, such as:
+
+    grid = {
+        'NUM_SERVERS': [2, 4, 8],
+        'HOLD': [Expression('chute.dist.exponential(.75)'),
+                 Expression('chute.dist.uniform(0, 2)')]
+    }
+
+Parameters are variables assigned at the top level of the model files, like
+NUM_SERVERS in examples/mmkrazy.py. At each point, those assignments take
+the point's values instead of their own. Values can be any object, or an
+Expression, which is Python source evaluated in the model in place of the
+original value. That way distributions can be swept without having to be
+pickled.
+
+Every replication of every point is run separately, so a pool of worker
+processes picks up the next one as soon as it is free, and points that take
+longer than others do not leave workers idle. Replications with the same
+number use the same random streams at every point, which makes differences
+between points stand out more clearly than independent streams would.
+'''
+from chute.runner import replicate, write_diagnostic
+from chute.stats import SUMMARY_FIELDS, write_summary
+import ast
+import itertools
+import marshal
+import multiprocessing
+import sys
+
+# Compiled points and the arguments they run with, in each worker process.
+_WORKER = {}
+
+
+class Expression(object):
+    '''A parameter value given as Python source, evaluated in the model.'''
+    def __init__(self, source):
+        self.source = source
+        self.tree = ast.parse(source.strip(), mode='eval').body
+
+    def __getstate__(self):
+        return self.source
+
+    def __setstate__(self, source):
+        self.__init__(source)
+
+    def __repr__(self):
+        return 'Expression(%r)' % self.source
+
+    def __str__(self):
+        return self.source
+
+
+def parse_param(text):
+    '''
+    Parses a parameter as given on the command line, in the form of
+    NAME=VALUE,VALUE,... where each value is a Python expression. Returns
+    its name and list of Expressions. Raises ValueError if it is malformed.
+    '''
+    name, equals, values = text.partition('=')
+    name = name.strip()
+    if not equals or not name.isidentifier() or not values.strip():
+        raise ValueError('parameters must be NAME=VALUE,VALUE,...')
+
+    # Values are split like the items of a tuple, so commas in function
+    # calls stay where they are.
+    source = '(%s,)' % values
+    try:
+        elts = ast.parse(source, mode='eval').body.elts
+    except SyntaxError:
+        raise ValueError('cannot parse the values of %s' % name)
+    return name, [Expression(ast.get_source_segment(source, e)) for e in elts]
+
+
+def points(grid):
+    '''
+    Returns every combination of values in a grid, which is a dict of
+    parameter name -> list of values, as a list of dicts.
+    '''
+    names = list(grid)
+    return [
+        dict(zip(names, values))
+        for values in itertools.product(*(grid[name] for name in names))
+    ]
+
+
+def compile_point(models, params):
+    '''
+    Reads and compiles a list of model files for a point, whose parameters
+    replace what the models assign to them at the top level. Raises
+    ValueError if a parameter is never assigned.
+    '''
+    code = []
+    assigned = set()
+    for model in models:
+        with open(model) as f:
+            tree = ast.parse(f.read(), model)
+
+        for statement in tree.body:
+            if not isinstance(statement, ast.Assign):
+                continue
+            if len(statement.targets) != 1:
+                continue
+            target = statement.targets[0]
+            if not isinstance(target, ast.Name) or target.id not in params:
+                continue
+
+            # Expressions are evaluated in the model. Anything else is
+            # looked up in the parameters the model is loaded with.
+            value = params[target.id]
+            if isinstance(value, Expression):
+                statement.value = value.tree
+            else:
+                statement.value = ast.Subscript(
+                    value=ast.Name(id='__sweep__', ctx=ast.Load()),
+                    slice=ast.Constant(value=target.id),
+                    ctx=ast.Load()
+                )
+            ast.copy_location(statement.value, statement)
+            assigned.add(target.id)
+
+        ast.fix_missing_locations(tree)
+        code.append(compile(tree, model, 'exec'))
+
+    missing = set(params).difference(assigned)
+    if missing:
+        raise ValueError(
+            'models do not assign %s' % ', '.join(sorted(missing))
+        )
+    return code
+
+
+def compile_points(models, grid):
+    '''
+    Compiles a list of model files for every point of a grid, in the order
+    of points. Raises ValueError if the models do not assign a parameter.
+    '''
+    return [compile_point(models, params) for params in points(grid)]
+
+
+def _tag(value):
+    '''How a parameter value is written out.'''
+    if isinstance(value, Expression):
+        try:
+            return ast.literal_eval(value.source.strip())
+        except (SyntaxError, ValueError):
+            return value.source
+    if isinstance(value, (bool, int, float, str)) or value is None:
+        return value
+    return str(value)
+
+
+def _run(code, index, params, num, kwds):
+    rows, _, diagnostic, _ = replicate(code, num, params=params, **kwds)
+    return index, num, rows, diagnostic
+
+
+def _init_worker(code, grid_points, kwds):
+    '''Keeps what every replication needs once per worker process.'''
+    _WORKER['code'] = marshal.loads(code)
+    _WORKER['points'] = grid_points
+    _WORKER['kwds'] = kwds
+
+
+def _sweep_worker(task):
+    '''Runs one replication of a point in a worker.'''
+    index, num = task
+    return _run(
+        _WORKER['code'][index],
+        index,
+        _WORKER['points'][index],
+        num,
+        _WORKER['kwds']
+    )
+
+
+def sweeps(models, grid, num, time, jobs=1, seed=None, warmup=0,
+           watchdog=None, code=None):
+    '''
+    Runs replications 0 to num-1 of a list of model files at every point of
+    a grid, collecting statistics. Yields a tuple of (point, replication
+    number, summary rows, diagnostic) for each replication as it finishes,
+    in no particular order with more than one job. The point is a dict of
+    its parameter values, and the other parameters are the same as for
+    chute.runner.run.
+
+    Every point is compiled once, before anything runs, unless code is
+    already the models compiled by compile_points.
+    '''
+    grid_points = points(grid)
+    if code is None:
+        code = compile_points(models, grid)
+    tasks = [(i, n) for n in range(num) for i in range(len(grid_points))]
+    kwds = {
+        'time':     time,
+        'out':      None,
+        'fmt':      'null',
+        'seed':     seed,
+        'stats':    True,
+        'warmup':   warmup,
+        'watchdog': watchdog
+    }
+
+    if jobs <= 1:
+        for index, n in tasks:
+            params = grid_points[index]
+            _, _, rows, diagnostic = _run(code[index], index, params, n, kwds)
+            yield params, n, rows, diagnostic
+        return
+
+    # Code objects cannot be pickled to send to the workers, but marshalled.
+    pool = multiprocessing.Pool(
+        jobs,
+        initializer=_init_worker,
+        initargs=(marshal.dumps(code), grid_points, kwds)
+    )
+    finished = False
+    try:
+        for index, n, rows, diagnostic in pool.imap_unordered(
+                _sweep_worker, tasks):
+            yield grid_points[index], n, rows, diagnostic
+        finished = True
+    finally:
+        if finished:
+            pool.close()
+        else:
+            pool.terminate()
+        pool.join()
+
+
+def sweep(models, grid, num, time, out=sys.stdout, fmt='csv', jobs=1,
+          seed=None, warmup=0, watchdog=None, diagnostics=sys.stderr,
+          code=None):
+    '''
+    Runs a parameter sweep and writes the summary rows of every replication
+    to out as soon as it finishes. Rows have a field for each parameter,
+    followed by SUMMARY_FIELDS. The parameters are the same as for sweeps,
+    and the rest the same as for chute.runner.run.
+    '''
+    names = tuple(grid)
+    fields = names + SUMMARY_FIELDS
+    results = sweeps(
+        models,
+        grid,
+        num,
+        time,
+        jobs,
+        seed,
+        warmup,
+        watchdog,
+        code
+    )
+    for n, (params, _, rows, diagnostic) in enumerate(results):
+        tags = tuple(_tag(params[name]) for name in names)
+        write_summary(out, [tags + row for row in rows], fmt, n < 1, fields)
+        if diagnostic is not None:
+            diagnostics.write('%s: ' % ', '.join(
+                '%s=%s' % (name, params[name]) for name in names
+            ))
+            write_diagnostic(diagnostics, diagnostic)
+        out.flush()
@@ -0,0 +1,134 @@
+'''
+Trace-driven arrivals. Instead of an interarrival time, a process can be
+given a Trace of the times its instances arrive, such as a log of requests
+to a production system:
+
+    @chute.process(chute.Trace('arrivals.csv', column='timestamp'))
+    def customer():
+        yield chute.request, 'server'
+        yield chute.hold, chute.dist.exponential(0.25)
+        yield chute.release
+
+Traces are read lazily, one arrival at a time, and every simulation replays
+the trace from the start. Two kinds of files are understood:
+
+    - binary: little-endian float64 times, one after another with no
+      header, which are memory-mapped
+    - csv: one arrival per row, with the times in one of the columns, which
+      are streamed. A first row that is not a number is taken as a header.
+
+Times must not decrease. Arrivals stop once the trace runs out.
+'''
+import csv
+import functools
+import itertools
+import mmap
+import os
+import struct
+
+# File extensions read as CSV unless a format is given. Anything else is
+# read as binary.
+CSV_EXTENSIONS = '.csv', '.txt'
+
+
+class Trace(object):
+    '''
+    A file of arrival times. Parameters:
+
+        - filename: name of the file
+        - fmt (default=None): 'binary' or 'csv', or None to go by the file
+          extension
+        - column (default=0): number or header name of the CSV column that
+          holds the times
+        - origin (default=None): time in the trace that corresponds to time
+          0 in the simulation, or None for the first time in the trace
+        - scale (default=1.0): factor that converts trace times into
+          simulation times, such as 0.001 for milliseconds into seconds
+    '''
+    def __init__(self, filename, fmt=None, column=0, origin=None, scale=1.0):
+        if fmt is None:
+            extension = os.path.splitext(filename)[1].lower()
+            fmt = 'csv' if extension in CSV_EXTENSIONS else 'binary'
+        if fmt not in ('binary', 'csv'):
+            raise ValueError('unknown trace format: %r' % fmt)
+
+        self.filename = filename
+        self.fmt = fmt
+        self.column = column
+        self.origin = origin
+        self.scale = scale
+
+    def __repr__(self):
+        return 'Trace(%r)' % self.filename
+
+    def times(self):
+        '''Iterates over the times in the trace, as they are in the file.'''
+        if self.fmt == 'csv':
+            return self._csv_times()
+        return self._binary_times()
+
+    def _binary_times(self):
+        with open(self.filename, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size % 8:
+                raise ValueError(
+                    '%s is not a whole number of float64 times' %
+                    self.filename
+                )
+            if not size:
+                return
+
+            # The map stays open as long as this generator is around, and
+            # only the pages being read need to be in memory.
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        for (time,) in struct.iter_unpack('<d', data):
+            yield time
+
+    def _csv_times(self):
+        with open(self.filename) as f:
+            rows = csv.reader(f)
+            index = self.column
+            for number, row in enumerate(rows):
+                if not row:
+                    continue
+                if number == 0 and not isinstance(index, int):
+                    index = row.index(index)
+                    continue
+                try:
+                    time = float(row[index])
+                except ValueError:
+                    if number == 0:
+                        continue  # Header.
+                    raise ValueError(
+                        '%s line %d: bad time %r' %
+                        (self.filename, number + 1, row[index])
+                    )
+                yield time
+
+    def _interarrivals(self, times, origin):
+        last = 0.0
+        for time in times:
+            time = (time - origin) * self.scale
+            if time < last:
+                raise ValueError(
+                    '%s: times must not decrease' % self.filename
+                )
+            yield time - last
+            last = time
+
+    def interarrivals(self):
+        '''
+        Returns a function that gives the time until each next arrival, and
+        raises StopIteration after the last one. This is how the simulator
+        replays the trace.
+        '''
+        times = self.times()
+        try:
+            first = next(times)
+        except StopIteration:
+            raise ValueError('%s has no arrivals' % self.filename)
+
+        origin = first if self.origin is None else self.origin
+        gaps = self._interarrivals(itertools.chain((first,), times), origin)
+        return functools.partial(next, gaps)
@@ -0,0 +1,172 @@
+'''
+Deadlock and starvation detection. Processes that request each other, or
+hold on to resources while waiting for more, can end up waiting forever.
+The simulation then keeps creating new processes that pile up behind them
+until it reaches its time limit. A Watchdog passed to a Simulator checks for
+this every so often and stops the simulation early, leaving a diagnostic
+record in the simulator's diagnostic attribute:
+
+    - simulation:  simulation number
+    - clock:       time the simulation was stopped
+    - reason:      'deadlock' or 'starvation'
+    - processes:   processes at the heart of the problem
+    - resources:   resources they are stuck on
+    - blocked:     number of processes that are blocked
+
+It looks at the processes parked on wait lists, so it needs those turned on.
+'''
+from chute.resource import Pool, Unit, describe
+
+DIAGNOSTIC_FIELDS = (
+    'simulation',
+    'clock',
+    'reason',
+    'processes',
+    'resources',
+    'blocked'
+)
+
+
+def _holders(simulator, pools, resource):
+    '''The processes a resource is assigned to.'''
+    if isinstance(resource, Pool):
+        return pools.get(resource, ())
+    holder = simulator.assigned.get(resource)
+    return () if holder is None else (holder,)
+
+
+class Watchdog(object):
+    '''
+    Stops a simulation once some of its processes can never continue.
+    Parameters:
+
+        - interval (default=100): number of events processed or blocked
+          between checks. Each check looks at every process on a wait list
+          or holding resources, so checks are spread out to at least that
+          many events apart, which keeps their cost per event bounded.
+        - starvation (default=None): longest time a process may wait on
+          resources before the simulation is stopped, or None to let them
+          wait as long as they can still be served
+    '''
+    def __init__(self, interval=100, starvation=None):
+        self.interval = interval
+        self.starvation = starvation
+
+    def delay(self, simulator):
+        '''Returns the number of events until the next check.'''
+        return max(
+            self.interval,
+            len(simulator.waits) + len(simulator.assignees)
+        )
+
+    def check(self, simulator):
+        '''Returns a diagnostic dict if the simulation should stop, or None.'''
+        blocked = {}
+        for event_gen in simulator.waits:
+            blocked[event_gen] = self._needs(simulator, event_gen)
+        if not blocked:
+            return None
+
+        # Units of a pool are spread over many processes.
+        pools = {}
+        for requester, resources in simulator.assignees.items():
+            for resource in resources:
+                if isinstance(resource, Unit):
+                    pools.setdefault(resource.pool, []).append(requester)
+
+        stuck = self._stuck(simulator, blocked, pools)
+        if stuck:
+            # Report the stuck processes others are waiting on, and what of
+            # theirs is needed. Anything held by a finished process counts
+            # too, since it will never be released.
+            processes = set()
+            resources = set()
+            for event_gen in stuck:
+                for options in blocked[event_gen]:
+                    for resource in options:
+                        for holder in _holders(simulator, pools, resource):
+                            if holder in stuck or holder.done:
+                                processes.add(describe(holder))
+                                resources.add(describe(resource))
+            return self._diagnostic(
+                simulator,
+                'deadlock',
+                processes,
+                resources,
+                len(blocked)
+            )
+
+        if self.starvation is not None:
+            processes = set()
+            resources = set()
+            for event_gen, needs in blocked.items():
+                waited = simulator.clock - event_gen.peek.sent_time
+                if waited > self.starvation:
+                    processes.add(describe(event_gen))
+                    for options in needs:
+                        resources.update(describe(r) for r in options)
+            if processes:
+                return self._diagnostic(
+                    simulator,
+                    'starvation',
+                    processes,
+                    resources,
+                    len(blocked)
+                )
+
+        return None
+
+    def _needs(self, simulator, event_gen):
+        '''
+        What a blocked process needs, as a list of tuples of resources. It
+        needs one resource out of every tuple. A process that is assigned to
+        another one needs that one to release it before anything else.
+        '''
+        event = event_gen.peek
+        if event_gen in simulator.assigned or event.event_type != 'request':
+            return [(event_gen,)]
+        return [
+            tuple(simulator._get_resource(o) for o in options)
+            for options in event.unassigned
+        ]
+
+    def _stuck(self, simulator, blocked, pools):
+        '''
+        Returns the blocked processes that can never continue. Every process
+        that is not blocked will get around to releasing what it holds, as
+        will blocked ones that only wait on those. Whatever is left over
+        after repeatedly setting those free is stuck for good.
+        '''
+        def obtainable(resource):
+            if isinstance(resource, Pool):
+                if simulator.available(resource):
+                    return True
+            elif resource not in simulator.assigned:
+                return True
+
+            for holder in _holders(simulator, pools, resource):
+                if not holder.done and holder not in stuck:
+                    return True
+            return False
+
+        stuck = set(blocked)
+        changed = True
+        while changed:
+            changed = False
+            for event_gen in list(stuck):
+                if all(any(obtainable(r) for r in options)
+                       for options in blocked[event_gen]):
+                    stuck.discard(event_gen)
+                    changed = True
+
+        return stuck
+
+    def _diagnostic(self, simulator, reason, processes, resources, blocked):
+        return {
+            'simulation': simulator.num,
+            'clock':      simulator.clock,
+            'reason':     reason,
+            'processes':  sorted(processes),
+            'resources':  sorted(resources),
+            'blocked':    blocked
+        }